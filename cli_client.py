@@ -28,17 +28,20 @@ async def register_user(username: str, password: str) -> bool:
     except:
         return False
 
-async def login_user(username: str, password: str) -> bool:
-    """Login through gateway"""
+async def login_user(username: str, password: str):
+    """Login through gateway, returns the session token (None if login failed)"""
     try:
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 f"{GATEWAY_URL}/login",
                 json={"username": username, "password": password}
             ) as resp:
-                return resp.status == 200
+                if resp.status != 200:
+                    return None
+                data = await resp.json()
+                return data.get("token", "")
     except:
-        return False
+        return None
 
 async def receiver(ws, queue):
     """Receive WebSocket messages"""
@@ -76,18 +79,22 @@ async def main():
                 return
         
         print("Logging in...")
-        if await login_user(username, password):
+        token = await login_user(username, password)
+        if token is not None:
             print("Login successful!")
         else:
             print("Login failed - wrong username or password")
             return
         
-        # WebSocket auth
-        await ws.send(json.dumps({
-            "type": "auth",
-            "username": username,
-            "password": password
-        }))
+        # WebSocket auth (with the session token, so the gateway can skip the user service)
+        if token:
+            await ws.send(json.dumps({"type": "auth", "token": token}))
+        else:
+            await ws.send(json.dumps({
+                "type": "auth",
+                "username": username,
+                "password": password
+            }))
         
         # Wait for logged_in
         while True:
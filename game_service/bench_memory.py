@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark: bytes per live game in the game service's games table.
+
+    python -m game_service.bench_memory
+    python -m game_service.bench_memory --games 100000
+
+Compares the GameRecord table with the old one-dict-per-game layout.
+Names and room IDs are created before measuring, since the service receives
+them in requests either way; the numbers are the cost of the table itself.
+"""
+import argparse
+import gc
+import tracemalloc
+
+from game_service.engine import GameEngine
+
+
+def measure(build, count: int) -> int:
+    """Bytes allocated (and still alive) by build()"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    table = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(table) == count
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bytes per live game")
+    parser.add_argument("--games", type=int, default=1_000_000)
+    args = parser.parse_args()
+    n = args.games
+
+    room_ids = [f"R{i}" for i in range(n)]
+    players = [[f"user{2 * i}", f"user{2 * i + 1}"] for i in range(n)]
+
+    def build_engine():
+        engine = GameEngine()
+        for room_id, pair in zip(room_ids, players):
+            engine.start(room_id, pair)
+            engine.move(room_id, pair[0], 7)  # a game in progress
+        return engine.games
+
+    def build_dicts():
+        # The layout game_service used before GameRecord
+        games = {}
+        for room_id, pair in zip(room_ids, players):
+            games[room_id] = {"sum": 7, "turn": pair[1], "players": list(pair), "winner": None}
+        return games
+
+    print(f"{n} live games")
+    for name, build in (("GameRecord", build_engine), ("dict per game", build_dicts)):
+        total = measure(build, n)
+        print(f"{name:>14}: {total / n:6.1f} bytes/game ({total / 2 ** 20:.1f} MiB total)")
+
+
+if __name__ == "__main__":
+    main()
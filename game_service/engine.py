@@ -0,0 +1,284 @@
+# game_service/engine.py
+# The game rules, with no web framework attached.
+# Used by the game service over HTTP, or directly inside the gateway (GAME_MODE=embedded).
+import json
+import os
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Deque, List, NamedTuple, Optional, Tuple
+
+from shared.state import MemoryStateStore, StateBusy
+
+PRIMES = [2, 3, 5, 7, 11]
+TARGET = 31
+
+# Seconds to keep a game after it is won (so players can still restart it)
+FINISHED_RETENTION = float(os.environ.get("GAME_FINISHED_RETENTION", "600"))
+# Seconds to keep a game nobody has moved in
+IDLE_RETENTION = float(os.environ.get("GAME_IDLE_RETENTION", "3600"))
+# Attempts to apply a change when another worker keeps changing the same game
+CAS_RETRIES = 10
+
+
+class Position(NamedTuple):
+    """What is known about a sum, for the player whose turn it is"""
+    sum: int
+    moves: Tuple[int, ...]     # legal primes from here
+    move_set: frozenset        # same, for O(1) checks
+    terminal: bool             # no legal moves: whoever reached this sum has won
+    winning: bool              # player to move can force a win
+    best_move: Optional[int]   # a move that keeps a forced win (None if losing/terminal)
+
+
+@lru_cache(maxsize=None)
+def build_positions(primes: Tuple[int, ...], target: int) -> Tuple[Position, ...]:
+    """Solve the game for every sum 0..target (index = sum).
+
+    Reaching the target, or a sum the opponent cannot move from, wins.
+    Works backwards from the target, so each sum is looked at once.
+    """
+    table: List[Optional[Position]] = [None] * (target + 1)
+    for s in range(target, -1, -1):
+        moves = tuple(p for p in sorted(primes) if s + p <= target)
+        best_move = None
+        for p in moves:
+            after = table[s + p]
+            # The move wins now (after.terminal) or leaves the opponent lost
+            if after.terminal or not after.winning:
+                best_move = p
+                break
+        table[s] = Position(
+            sum=s,
+            moves=moves,
+            move_set=frozenset(moves),
+            terminal=not moves,
+            winning=best_move is not None,
+            best_move=best_move,
+        )
+    return tuple(table)
+
+
+# Table for the default rules, built once at import
+POSITIONS = build_positions(tuple(PRIMES), TARGET)
+
+
+# One shared bytes object per prime, so a game's first move allocates nothing
+MOVE_BYTES = {p: bytes((p,)) for p in range(256)}
+
+
+class GameError(Exception):
+    """A rejected action. status_code matches what the HTTP service returns."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class GameRecord:
+    """One game, kept small: there can be millions of these.
+
+    No per-game dict or players list: turn and winner are player indexes
+    (0/1, -1 = no winner) and the small ints are shared by Python, so a record
+    is a single ~90 byte object. The primes played since the last (re)start are
+    kept as bytes; players alternate starting with player0, so that is the
+    whole history.
+    """
+    __slots__ = ("player0", "player1", "sum", "turn", "winner", "updated", "moves")
+
+    def __init__(self, player0: str, player1: str, updated: int):
+        self.player0 = player0
+        self.player1 = player1
+        self.sum = 0
+        self.turn = 0
+        self.winner = -1
+        self.updated = updated
+        self.moves = b""
+
+    def player(self, index: int) -> str:
+        return self.player0 if index == 0 else self.player1
+
+    def to_row(self) -> str:
+        """Compact text form for shared state stores"""
+        return json.dumps([self.player0, self.player1, self.sum, self.turn, self.winner, self.updated,
+                           list(self.moves)])
+
+    @classmethod
+    def from_row(cls, row: str) -> "GameRecord":
+        return cls.from_fields(json.loads(row))
+
+    @classmethod
+    def from_fields(cls, fields: list) -> "GameRecord":
+        player0, player1, total, turn, winner, updated, *moves = fields
+        game = cls(player0, player1, updated)
+        game.sum, game.turn, game.winner = total, turn, winner
+        game.moves = bytes(moves[0]) if moves else b""
+        return game
+
+    def to_dict(self) -> dict:
+        return {
+            "sum": self.sum,
+            "turn": self.player(self.turn),
+            "players": [self.player0, self.player1],
+            "winner": self.player(self.winner) if self.winner >= 0 else None,
+        }
+
+
+class GameEngine:
+    """All running games, keyed by room_id.
+
+    Games live in a state store (shared/state.py): a dict in this process by
+    default, or a shared SQLite store so several workers can serve the same
+    games. Every change is a compare-and-set, retried if another worker got
+    there first.
+
+    Finished games are dropped finished_retention seconds after they end and
+    any game is dropped after idle_retention seconds without a move, when
+    sweep() runs (the services call it every few seconds).
+    """
+
+    def __init__(self, primes: List[int] = PRIMES, target: int = TARGET,
+                 finished_retention: float = FINISHED_RETENTION, idle_retention: float = IDLE_RETENTION,
+                 store=None):
+        self.primes = primes
+        self.target = target
+        self.positions = build_positions(tuple(primes), target)
+        self.finished_retention = finished_retention
+        self.idle_retention = idle_retention
+        self.games = store if store is not None else MemoryStateStore("games")
+        self.finished: Deque[Tuple[int, str]] = deque()  # (finish time, room_id), oldest first
+        # Coarse clock (whole seconds) refreshed by sweep(); every record stores
+        # this same int object instead of allocating its own timestamp
+        self.now = int(time.time())
+        self.last_idle_sweep = self.now
+
+    def _update(self, room_id: str, change: Callable[[GameRecord], dict]) -> Tuple[GameRecord, dict]:
+        """Read a game, apply change() and write it back with compare-and-set.
+
+        change() must raise GameError before touching the game if the action is
+        not allowed. Retries when another worker changed the game in between.
+        """
+        for _ in range(CAS_RETRIES):
+            try:
+                found = self.games.get(room_id)
+                if found is None:
+                    raise GameError(404, "Game not found")
+                game, version = found
+                result = change(game)
+                if self.games.cas(room_id, game, version):
+                    return game, result
+            except StateBusy:
+                break  # another worker holds the database; answer now instead of blocking
+        raise GameError(409, "Game is busy, try again")
+
+    def start(self, room_id: str, players: List[str]) -> dict:
+        self.games.put(room_id, GameRecord(players[0], players[1], self.now))
+        return {"message": "started"}
+
+    def restart(self, room_id: str) -> dict:
+        """Restart a finished game with the same players"""
+        def reset(game: GameRecord) -> dict:
+            # Start with first player again
+            game.sum = 0
+            game.turn = 0
+            game.winner = -1
+            game.updated = self.now
+            game.moves = b""
+            return {"message": "restarted", "turn": game.player0}
+        return self._update(room_id, reset)[1]
+
+    def state(self, room_id: str) -> dict:
+        found = self.games.get(room_id)
+        if found is None:
+            raise GameError(404, "Game not found")
+        return found[0].to_dict()
+
+    def history(self, room_id: str) -> List[dict]:
+        """Moves since the game was (re)started: [{"player", "prime", "sum"}, ...]"""
+        found = self.games.get(room_id)
+        if found is None:
+            raise GameError(404, "Game not found")
+        game = found[0]
+        total = 0
+        moves = []
+        for i, prime in enumerate(game.moves):
+            total += prime
+            moves.append({"player": game.player(i % 2), "prime": prime, "sum": total})
+        return moves
+
+    def analyze(self, current_sum: int) -> Position:
+        """Legal moves and the optimal move from a sum"""
+        if not 0 <= current_sum <= self.target:
+            raise GameError(400, f"Sum must be between 0 and {self.target}")
+        return self.positions[current_sum]
+
+    def move(self, room_id: str, username: str, prime: int) -> dict:
+        """Apply a move. Returns {"sum", "turn"} or {"winner"}."""
+        def play(game: GameRecord) -> dict:
+            if game.winner >= 0:
+                raise GameError(400, "Game finished")
+
+            if username != game.player(game.turn):
+                raise GameError(400, "Not your turn!")
+
+            # Callers in this process (GAME_MODE=embedded) skip pydantic, so 2.0 or True can get here
+            if type(prime) is not int:
+                raise GameError(400, f"Invalid prime! Use: {self.primes}")
+            position = self.positions[game.sum]
+            if prime not in position.move_set:
+                if prime not in self.primes:
+                    raise GameError(400, f"Invalid prime! Use: {self.primes}")
+                raise GameError(400, f"Cannot exceed {self.target}!")
+
+            # Work out the result before touching the game, so a failure leaves it as it was
+            new_sum = game.sum + prime
+            new_position = self.positions[new_sum]
+            move_byte = MOVE_BYTES[prime]
+
+            # UPDATE GAME
+            game.sum = new_sum
+            game.updated = self.now
+            game.moves += move_byte
+
+            # WIN CONDITION 1: Exactly 31
+            # WIN CONDITION 2: Opponent has NO MOVES LEFT (like 30/31)
+            if new_sum == self.target or new_position.terminal:
+                game.winner = game.turn  # You win (opponent can't move on a terminal sum)
+                return {"winner": username}
+
+            # Switch turn
+            game.turn = 1 - game.turn
+            return {"sum": new_sum, "turn": game.player(game.turn)}
+
+        game, result = self._update(room_id, play)
+        if game.winner >= 0:
+            self.finished.append((game.updated, room_id))
+        return result
+
+    def sweep(self) -> int:
+        """Advance the clock and evict old games. Returns how many were removed."""
+        self.now = int(time.time())
+        removed = 0
+
+        # Finished games, in the order they finished
+        deadline = self.now - self.finished_retention
+        while self.finished and self.finished[0][0] <= deadline:
+            finished_at, room_id = self.finished.popleft()
+            found = self.games.get(room_id)
+            if found is None:
+                continue
+            game, version = found
+            # Skip games that were restarted (or replaced) since they finished
+            if game.winner >= 0 and game.updated == finished_at and self.games.delete(room_id, version):
+                removed += 1
+
+        # Idle games need a full scan, so only do it a few times per retention window
+        if self.now - self.last_idle_sweep >= self.idle_retention / 4:
+            self.last_idle_sweep = self.now
+            deadline = self.now - self.idle_retention
+            idle = [(room_id, version) for room_id, game, version in self.games.items() if game.updated <= deadline]
+            for room_id, version in idle:
+                if self.games.delete(room_id, version):
+                    removed += 1
+        return removed
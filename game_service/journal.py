@@ -0,0 +1,212 @@
+# game_service/journal.py
+# Write-ahead log of game actions, so a game service restart keeps every game.
+#
+#   wal-<n>.log    one JSON array per line: ["S", room, p0, p1] start,
+#                  ["M", room, username, prime] move, ["R", room] restart
+#   snapshot.json  a header line, then one game per line ([room, p0, p1, sum, ...]),
+#                  as they were when segment <n> was started
+#
+# Actions are queued in memory and a background task writes (and fsyncs) them
+# in batches on a worker thread: one disk write per batch however many games
+# are being played. Every SNAPSHOT_INTERVAL seconds the games are written to a
+# snapshot and a new segment is started, so recovery only replays the tail.
+import asyncio
+import glob
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+
+from game_service.engine import GameEngine, GameError, GameRecord
+
+WAL_FSYNC = os.environ.get("GAME_WAL_FSYNC", "always")                    # always | never
+SNAPSHOT_INTERVAL = float(os.environ.get("GAME_SNAPSHOT_INTERVAL", "60"))  # seconds
+
+
+class GameJournal:
+    """Log of start/move/restart for one GameEngine, with snapshots"""
+
+    def __init__(self, engine: GameEngine, directory: str, fsync: str = WAL_FSYNC,
+                 snapshot_interval: float = SNAPSHOT_INTERVAL):
+        self.engine = engine
+        self.directory = directory
+        self.fsync = fsync
+        self.snapshot_interval = snapshot_interval
+        self.segment = 0
+        self.file = None
+        self.pending: List[str] = []
+        self.waiters: List[asyncio.Future] = []
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task = None
+        self.stopping = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, n: int) -> str:
+        return os.path.join(self.directory, f"wal-{n}.log")
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        found = []
+        for path in glob.glob(os.path.join(self.directory, "wal-*.log")):
+            try:
+                found.append((int(os.path.basename(path)[4:-4]), path))
+            except ValueError:
+                pass
+        return sorted(found)
+
+    # Recovery
+
+    def recover(self) -> dict:
+        """Load the snapshot and replay the log after it. Call before serving requests."""
+        start = time.perf_counter()
+        games = replayed = 0
+        snapshot = os.path.join(self.directory, "snapshot.json")
+        first_segment = 0
+        if os.path.exists(snapshot):
+            with open(snapshot, "r", encoding="utf-8") as f:
+                first_segment = json.loads(f.readline())["segment"]
+                for line in f:
+                    room_id, *fields = json.loads(line)
+                    game = GameRecord.from_fields(fields)
+                    self.engine.games.put(room_id, game)
+                    if game.winner >= 0:
+                        self.engine.finished.append((game.updated, room_id))  # so the sweeper evicts it
+                    games += 1
+
+        last_segment = first_segment
+        for n, path in self._segments():
+            if n < first_segment:
+                continue
+            last_segment = n
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn last line from a crash
+                    self._apply(entry)
+                    replayed += 1
+
+        # Continue in a fresh segment; older ones are covered by the next snapshot
+        self.segment = last_segment + 1
+        self.file = open(self._segment_path(self.segment), "a", encoding="utf-8")
+        return {
+            "games": len(self.engine.games),
+            "from_snapshot": games,
+            "replayed": replayed,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+    def _apply(self, entry: list):
+        try:
+            if entry[0] == "M":
+                self.engine.move(entry[1], entry[2], entry[3])
+            elif entry[0] == "S":
+                self.engine.start(entry[1], entry[2:4])
+            elif entry[0] == "R":
+                self.engine.restart(entry[1])
+        except GameError:
+            pass  # e.g. a restart of a game that was evicted before the snapshot
+
+    # Writing
+
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def record(self, *entry) -> asyncio.Future:
+        """Queue an action; the future is done once it is written"""
+        self.pending.append(json.dumps(entry, separators=(",", ":")) + "\n")
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.wakeup.set()
+        return waiter
+
+    async def _run(self):
+        last_snapshot = time.monotonic()
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.snapshot_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self._flush()
+            if self.stopping:
+                break
+            if time.monotonic() - last_snapshot >= self.snapshot_interval:
+                await self.snapshot()
+                last_snapshot = time.monotonic()
+
+    async def _flush(self):
+        """Write everything queued so far as one batch (group commit)"""
+        if not self.pending:
+            return
+        lines, waiters = self.pending, self.waiters
+        self.pending, self.waiters = [], []
+        try:
+            await asyncio.to_thread(self._write, self.file, "".join(lines))
+        except Exception as e:
+            self._settle(waiters, e)
+            return
+        self._settle(waiters)
+
+    def _settle(self, waiters: List[asyncio.Future], error: Exception = None):
+        for waiter in waiters:
+            if not waiter.done():
+                if error is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(error)
+
+    def _write(self, file, data: str):
+        file.write(data)
+        file.flush()
+        if self.fsync == "always":
+            os.fsync(file.fileno())
+
+    async def snapshot(self):
+        """Save every game and start a new segment; older segments are deleted"""
+        # In one step on the event loop (no await): take the queued actions, copy
+        # the games they already changed, and start the next segment. The queued
+        # actions go to the old segment, which the snapshot replaces; anything
+        # recorded while the files are written goes to the new one.
+        lines, waiters = self.pending, self.waiters
+        self.pending, self.waiters = [], []
+        games = [
+            (room_id, game.player0, game.player1, game.sum, game.turn, game.winner, game.updated, game.moves)
+            for room_id, game, _ in self.engine.games.items()
+        ]
+        old_file = self.file
+        self.segment += 1
+        self.file = open(self._segment_path(self.segment), "a", encoding="utf-8")
+        try:
+            await asyncio.to_thread(self._write_snapshot, self.segment, games, old_file, "".join(lines))
+        except Exception as e:
+            self._settle(waiters, e)
+            raise
+        self._settle(waiters)
+
+    def _write_snapshot(self, segment: int, games: List[tuple], old_file, tail: str):
+        if tail:
+            self._write(old_file, tail)  # durable even if the snapshot below is cut off
+        old_file.close()
+        path = os.path.join(self.directory, "snapshot.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"segment": segment, "games": len(games), "time": time.time()}) + "\n")
+            for game in games:
+                f.write(json.dumps(game[:-1] + (list(game[-1]),)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        for n, old in self._segments():
+            if n < segment:
+                os.remove(old)
+
+    async def close(self):
+        """Write what is queued and take a final snapshot (fast next startup)"""
+        if self.task:
+            self.stopping = True
+            self.wakeup.set()
+            await self.task
+        await self.snapshot()
+        self.file.close()
@@ -1,91 +1,209 @@
 # game_service/main.py - WINNER AT 30/31 FIXED!
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import asyncio
+import json
+import os
 
-app = FastAPI(title="Game Rules Service")
+from game_service.engine import GameEngine, GameError, GameRecord, PRIMES, TARGET
+from game_service.journal import GameJournal
+from shared.state import STATE_STORE, StateBusy, make_store
+from shared.metrics import instrument, registry
+from shared.logs import get_logger
 
-PRIMES = [2, 3, 5, 7, 11]
-TARGET = 31
+# The rules live in engine.py so the gateway can also run them in-process.
+# With STATE_STORE=sqlite every worker (--workers N) shares the same games.
+engine = GameEngine(PRIMES, TARGET, store=make_store("games", encode=GameRecord.to_row, decode=GameRecord.from_row))
 
-games: Dict[str, dict] = {}
+# In-memory games are saved to a write-ahead log + snapshots and reloaded on
+# startup (GAME_WAL=off to disable). The SQLite state store is already on disk.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GAME_WAL = os.environ.get("GAME_WAL", "on") == "on" and STATE_STORE == "memory"
+GAME_WAL_DIR = os.environ.get("GAME_WAL_DIR", os.path.join(BASE_DIR, "wal"))
+journal = GameJournal(engine, GAME_WAL_DIR) if GAME_WAL else None
+
+SWEEP_INTERVAL = 5  # seconds between evictions of finished/idle games
+
+async def sweep_games():
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            engine.sweep()
+        except StateBusy:
+            pass  # the database is locked right now; next time
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if journal is not None:
+        print(f"Recovered games from {GAME_WAL_DIR}: {journal.recover()}")
+        journal.start()
+    sweeper = asyncio.create_task(sweep_games())
+    yield
+    sweeper.cancel()
+    if journal is not None:
+        await journal.close()
+    engine.games.close()
+
+app = FastAPI(title="Game Rules Service", lifespan=lifespan)
+instrument(app, "game")
+
+@app.exception_handler(StateBusy)
+async def state_busy(request, e: StateBusy):
+    """The shared database stayed locked (STATE_STORE=sqlite): retry, like a lost compare-and-set"""
+    return JSONResponse(status_code=409, content={"detail": "Game is busy, try again"})
+log = get_logger("game")
+
+registry.gauge("games", "Games in the games table", callback=lambda: len(engine.games))
+moves = registry.counter("game_moves_total", "Moves by outcome", ["result"])
 
 class MoveRequest(BaseModel):
     room_id: str
     username: str
     prime: int
 
+class MoveBatch(BaseModel):
+    moves: List[MoveRequest]
+
+class StartRequest(BaseModel):
+    room_id: str
+    players: List[str]
+
+class StartBatch(BaseModel):
+    games: List[StartRequest]
+
+async def saved(*entry):
+    """Wait until an action is in the write-ahead log (batched with every other request)"""
+    if journal is not None:
+        await journal.record(*entry)
+
 @app.post("/start")
 async def start_game(request: dict):
     room_id = request["room_id"]
     players = request["players"]
-    games[room_id] = {
-        "sum": 0,
-        "turn": players[0],
-        "players": players,
-        "winner": None
-    }
-    print(f"Game started: {room_id} with {players}")
-    return {"message": "started"}
+    result = engine.start(room_id, players)
+    await saved("S", room_id, players[0], players[1])
+    log.event("game_started", room_id=room_id, players=players)
+    return result
+
+@app.post("/start_many")
+async def start_many(batch: StartBatch):
+    """Start many games in one request (a tournament round)"""
+    writes = []
+    for req in batch.games:
+        engine.start(req.room_id, req.players)
+        writes.append(saved("S", req.room_id, req.players[0], req.players[1]))
+    await asyncio.gather(*writes)  # one group commit for the whole batch
+    log.event("games_started", count=len(batch.games))
+    return {"started": len(batch.games)}
 
 @app.post("/restart")
 async def restart_game(request: dict):
     """Restart a finished game with the same players"""
     room_id = request["room_id"]
-    if room_id not in games:
-        raise HTTPException(404, "Game not found")
-    
-    game = games[room_id]
-    players = game["players"]
-    
-    # Reset game state
-    games[room_id] = {
-        "sum": 0,
-        "turn": players[0],  # Start with first player again
-        "players": players,
-        "winner": None
+    try:
+        result = engine.restart(room_id)
+    except GameError as e:
+        raise HTTPException(e.status_code, e.detail)
+    await saved("R", room_id)
+    log.event("game_restarted", room_id=room_id)
+    return result
+
+@app.get("/state/{room_id}")
+async def game_state(room_id: str):
+    try:
+        return engine.state(room_id)
+    except GameError as e:
+        raise HTTPException(e.status_code, e.detail)
+
+@app.post("/state")
+async def game_state_by_body(request: dict):
+    """Same as GET /state/{room_id}, for callers that POST everything (the gateway)"""
+    return await game_state(request["room_id"])
+
+@app.get("/replay/{room_id}")
+async def replay(room_id: str):
+    """A game's moves since it was (re)started, streamed as JSON lines"""
+    try:
+        players = engine.state(room_id)["players"]
+        history = engine.history(room_id)
+    except GameError as e:
+        raise HTTPException(e.status_code, e.detail)
+
+    def lines():
+        yield json.dumps({"room_id": room_id, "players": players}) + "\n"
+        for number, move in enumerate(history, 1):
+            yield json.dumps({"move": number, **move}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def position_info(position) -> dict:
+    return {
+        "sum": position.sum,
+        "moves": list(position.moves),
+        "terminal": position.terminal,
+        "winning": position.winning,
+        "best_move": position.best_move,
     }
-    print(f"Game restarted: {room_id} with {players}")
-    return {"message": "restarted", "turn": players[0]}
+
+@app.get("/analyze")
+async def analyze(sum: Optional[int] = None, room_id: Optional[str] = None):
+    """Win/lose table for the game.
+
+    ?sum=N or ?room_id=R0 returns that one position (with the optimal move),
+    no parameters returns the whole table.
+    """
+    try:
+        if room_id is not None:
+            return position_info(engine.analyze(engine.state(room_id)["sum"]))
+        if sum is not None:
+            return position_info(engine.analyze(sum))
+    except GameError as e:
+        raise HTTPException(e.status_code, e.detail)
+    return {
+        "primes": PRIMES,
+        "target": TARGET,
+        "positions": [position_info(p) for p in engine.positions],
+    }
+
+def apply_move(req: MoveRequest) -> dict:
+    """Move with metrics and (sampled) logging; raises GameError"""
+    try:
+        result = engine.move(req.room_id, req.username, req.prime)
+    except GameError:
+        moves.inc("rejected")
+        raise
+    if "winner" in result:
+        moves.inc("win")
+        log.event("game_won", room_id=req.room_id, winner=req.username)
+    else:
+        moves.inc("ok")
+        log.sampled("move", room_id=req.room_id, username=req.username, prime=req.prime, sum=result["sum"])
+    return result
 
 @app.post("/move")
 async def make_move(req: MoveRequest):
-    if req.room_id not in games:
-        raise HTTPException(404, "Game not found")
-    
-    game = games[req.room_id]
-    
-    if game["winner"]:
-        raise HTTPException(400, "Game finished")
-    
-    if req.username != game["turn"]:
-        raise HTTPException(400, "Not your turn!")
-    
-    if req.prime not in PRIMES:
-        raise HTTPException(400, f"Invalid prime! Use: {PRIMES}")
-    
-    new_sum = game["sum"] + req.prime
-    if new_sum > TARGET:
-        raise HTTPException(400, f"Cannot exceed {TARGET}!")
-
-    # UPDATE GAME
-    game["sum"] = new_sum
-    
-    # WIN CONDITION 1: Exactly 31
-    if new_sum == TARGET:
-        game["winner"] = req.username
-        print(f"🎉 WINNER by exact 31 in {req.room_id}: {req.username}")
-        return {"winner": req.username}
-    
-    # WIN CONDITION 2: Opponent has NO MOVES LEFT (like 30/31)
-    possible_moves = [p for p in PRIMES if game["sum"] + p <= TARGET]
-    if not possible_moves:
-        game["winner"] = req.username  # You win because opponent can't move!
-        print(f"🎉 WINNER by trapping opponent in {req.room_id}: {req.username} (sum={new_sum})")
-        return {"winner": req.username}
-    
-    # Switch turn
-    game["turn"] = game["players"][1] if req.username == game["players"][0] else game["players"][0]
-    
-    print(f"Move: {req.prime} → sum={new_sum}, turn={game['turn']}, possible={possible_moves}")
-    return {"sum": new_sum, "turn": game["turn"]}
\ No newline at end of file
+    try:
+        result = apply_move(req)
+    except GameError as e:
+        raise HTTPException(e.status_code, e.detail)
+    await saved("M", req.room_id, req.username, req.prime)
+    return result
+
+
+@app.post("/moves")
+async def make_moves(batch: MoveBatch):
+    """Apply many moves in one request (used by the gateway's bot scheduler)"""
+    results = []
+    writes = []
+    for req in batch.moves:
+        try:
+            results.append({"status": 200, "result": apply_move(req)})
+        except GameError as e:
+            results.append({"status": e.status_code, "result": {"detail": e.detail}})
+            continue
+        writes.append(saved("M", req.room_id, req.username, req.prime))
+    await asyncio.gather(*writes)  # one group commit for the whole batch
+    return {"results": results}
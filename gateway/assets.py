@@ -0,0 +1,116 @@
+# gateway/assets.py
+# The web client's page, read once and served from memory.
+# The file is compressed once when it is loaded (gzip, and brotli if the
+# `brotli` package is installed), and each response picks the smallest variant
+# the browser accepts. Every variant has an ETag and the file's Last-Modified,
+# so a browser that already has the page gets an empty 304 instead.
+import asyncio
+import gzip
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_RELOAD = os.environ.get("STATIC_RELOAD", "off")  # on: re-read changed files (development)
+RELOAD_INTERVAL = 1.0  # seconds between checks with STATIC_RELOAD=on
+
+
+def accepted_encodings(header: str) -> set:
+    """Content codings from an Accept-Encoding header, without the ones refused with q=0"""
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name)
+    return accepted
+
+
+class StaticAsset:
+    """One file kept in memory with its compressed variants"""
+
+    def __init__(self, path: str, media_type: str):
+        self.path = path
+        self.media_type = media_type
+        self.mtime = 0.0
+        self.last_modified = ""
+        self.variants: Dict[str, bytes] = {}  # content coding ("identity", "gzip", "br") -> body
+        self.etags: Dict[str, str] = {}
+        self.load()
+
+    def load(self):
+        with open(self.path, "rb") as f:
+            body = f.read()
+        self.mtime = os.stat(self.path).st_mtime
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+        variants = {"identity": body, "gzip": gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, quality=11)
+        # Only keep a compressed variant if it is actually smaller
+        self.variants = {k: v for k, v in variants.items() if k == "identity" or len(v) < len(body)}
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        self.etags = {k: f'"{digest}"' if k == "identity" else f'"{digest}-{k}"' for k in self.variants}
+
+    def changed(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime != self.mtime
+        except OSError:
+            return False
+
+    def _not_modified(self, request: Request) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # Takes precedence over If-Modified-Since; weak comparison (W/ ignored)
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or not tags.isdisjoint(self.etags.values())
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                return int(self.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def response(self, request: Request) -> Response:
+        accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+        coding = next((c for c in ("br", "gzip") if c in self.variants and (c in accepted or "*" in accepted)),
+                      "identity")
+        headers = {
+            "ETag": self.etags[coding],
+            "Last-Modified": self.last_modified,
+            "Cache-Control": "no-cache",  # revalidate every time (cheap: 304), so new versions show up at once
+            "Vary": "Accept-Encoding",
+        }
+        if self._not_modified(request):
+            return Response(status_code=304, headers=headers)
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        return Response(self.variants[coding], media_type=self.media_type, headers=headers)
+
+
+async def watch(assets, interval: float = RELOAD_INTERVAL):
+    """Reload assets whose file changed (for STATIC_RELOAD=on)"""
+    while True:
+        await asyncio.sleep(interval)
+        for asset in assets:
+            if asset.changed():
+                try:
+                    asset.load()
+                    print(f"Reloaded {asset.path}")
+                except OSError as e:
+                    print(f"Cannot reload {asset.path}: {e}")
@@ -0,0 +1,158 @@
+# gateway/bots.py
+# Server-side bot players.
+# Bots join rooms through the normal room service /join, like a second human.
+# One scheduler task collects every bot whose turn it is and plays their moves
+# in batches, so thousands of bot games cost one task, not one per bot.
+import asyncio
+import itertools
+import os
+import random
+from typing import Callable, Dict, List, Set
+
+from game_service.engine import POSITIONS, Position
+
+BOT_BATCH_SIZE = int(os.environ.get("BOT_BATCH_SIZE", "1000"))   # moves per batch
+BOT_TICK = float(os.environ.get("BOT_TICK", "0.02"))             # seconds to collect a batch
+
+
+def random_move(position: Position) -> int:
+    return random.choice(position.moves)
+
+
+def greedy_move(position: Position) -> int:
+    """Win right now if possible, otherwise add as much as possible"""
+    for p in position.moves:
+        if POSITIONS[position.sum + p].terminal:
+            return p
+    return position.moves[-1]
+
+
+def perfect_move(position: Position) -> int:
+    """Play the winning move from the position table (smallest move when lost)"""
+    if position.best_move is not None:
+        return position.best_move
+    return position.moves[0]
+
+
+STRATEGIES: Dict[str, Callable[[Position], int]] = {
+    "random": random_move,
+    "greedy": greedy_move,
+    "perfect": perfect_move,
+}
+
+
+class BotScheduler:
+    """Plays every bot's turn from a single background task"""
+
+    def __init__(self, games, on_result, lanes, batch_size: int = BOT_BATCH_SIZE, tick: float = BOT_TICK):
+        self.games = games          # gateway.games backend (remote or embedded)
+        self.on_result = on_result  # async (room_id, result) -> None, announces a move
+        self.lanes = lanes          # gateway.lanes.KeyedLanes of the rooms: results run in order with players' actions
+        self.batch_size = batch_size
+        self.tick = tick
+        self.bots: Dict[str, str] = {}            # bot username -> strategy
+        self.room_bots: Dict[str, Set[str]] = {}  # room_id -> bot usernames
+        self.pending: Dict[str, tuple] = {}       # room_id -> (bot username, sum), in arrival order
+        self.restarts: Dict[str, int] = {}        # room_id -> times restarted, to spot moves made before
+        self.wakeup = asyncio.Event()
+        self.names = itertools.count()
+        self.task = None
+        self.stats = {"moves": 0, "batches": 0, "errors": 0}
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def create_bot(self, strategy: str) -> str:
+        """Make a new bot and return its username"""
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy! Use: {list(STRATEGIES)}")
+        username = f"bot-{strategy}-{next(self.names)}"
+        self.bots[username] = strategy
+        return username
+
+    def add_to_room(self, room_id: str, username: str):
+        self.room_bots.setdefault(room_id, set()).add(username)
+
+    def remove_bot(self, username: str):
+        self.bots.pop(username, None)
+
+    def is_bot(self, username: str) -> bool:
+        return username in self.bots
+
+    def forget_room(self, room_id: str):
+        """Remove the bots of a room nobody is playing in any more"""
+        for username in self.leave_room(room_id):
+            self.bots.pop(username, None)
+
+    def leave_room(self, room_id: str) -> Set[str]:
+        """Take the bots out of a room but keep them (e.g. for the next tournament round)"""
+        self.pending.pop(room_id, None)
+        self.restarts.pop(room_id, None)
+        return self.room_bots.pop(room_id, set())
+
+    def on_update(self, room_id: str, current_sum: int, turn: str):
+        """Called after every game change; queues a move if a bot is next"""
+        if turn in self.bots:
+            self.pending[room_id] = (turn, current_sum)
+            self.wakeup.set()
+        else:
+            self.pending.pop(room_id, None)  # e.g. a restart gave the turn back to the player
+
+    def restarted(self, room_id: str):
+        """The room's game was restarted: results of moves sent before are dropped"""
+        if room_id in self.room_bots:
+            self.restarts[room_id] = self.restarts.get(room_id, 0) + 1
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            await asyncio.sleep(self.tick)  # let more turns pile up into one batch
+            while self.pending:
+                if not await self._play_batch():
+                    await asyncio.sleep(1)  # game service unreachable, retry shortly
+                await asyncio.sleep(0)  # let the WebSockets run between batches
+
+    async def _play_batch(self) -> bool:
+        room_ids = list(itertools.islice(self.pending, self.batch_size))
+        turns = {room_id: self.pending.pop(room_id) for room_id in room_ids}
+        restarts = {room_id: self.restarts.get(room_id, 0) for room_id in room_ids}
+        moves: List[tuple] = []
+        for room_id, (username, current_sum) in turns.items():
+            strategy = STRATEGIES[self.bots[username]]
+            moves.append((room_id, username, strategy(POSITIONS[current_sum])))
+
+        try:
+            results = await self.games.move_batch(moves)
+        except Exception:
+            # Put the turns back (unless a newer update replaced them)
+            self.stats["errors"] += 1
+            for room_id, turn in turns.items():
+                self.pending.setdefault(room_id, turn)
+            return False
+        self.stats["batches"] += 1
+        self.stats["moves"] += len(moves)
+        for (room_id, _, _), (status, result) in zip(moves, results):
+            if status != 200:
+                self.stats["errors"] += 1
+                continue
+            self.lanes.submit(room_id, self._announce(room_id, result, restarts[room_id]))
+        return True
+
+    async def _announce(self, room_id: str, result: dict, restarts: int):
+        """Runs in the room's lane, after any restart queued before it"""
+        if self.restarts.get(room_id, 0) != restarts:
+            return  # made on the game as it was before a restart
+        try:
+            await self.on_result(room_id, result)
+        except Exception:
+            self.stats["errors"] += 1
+
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Broadcast broker for running the gateway with several workers (BUS=unix).
+
+    python -m gateway.broker                     # listens on BUS_PATH
+    BUS=unix python -m uvicorn gateway.main:app --port 8000 --workers 4
+
+Workers subscribe to the rooms they have players in; a message published by
+one worker is forwarded to every other worker subscribed to that room.
+See gateway/bus.py for the line protocol.
+"""
+import argparse
+import asyncio
+import os
+from collections import defaultdict
+from typing import Dict, Set
+
+from gateway.bus import BUS_PATH
+
+MAX_BUFFER = 16 * 2 ** 20  # bytes queued for one worker before we drop it as stuck
+
+subscribers: Dict[bytes, Set[asyncio.StreamWriter]] = defaultdict(set)  # room -> workers
+
+
+async def handle_worker(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    rooms: Set[bytes] = set()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            op = line[:1]
+            if op == b"P":
+                room = line[2:].split(b" ", 1)[0]
+                for other in list(subscribers.get(room, ())):
+                    if other is writer:
+                        continue
+                    if other.transport.get_write_buffer_size() > MAX_BUFFER:
+                        other.close()  # its read loop cleans up
+                        continue
+                    other.write(line)
+            elif op == b"S":
+                room = line[2:].rstrip(b"\n")
+                subscribers[room].add(writer)
+                rooms.add(room)
+            elif op == b"U":
+                room = line[2:].rstrip(b"\n")
+                rooms.discard(room)
+                _unsubscribe(room, writer)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        for room in rooms:
+            _unsubscribe(room, writer)
+        writer.close()
+
+
+def _unsubscribe(room: bytes, writer: asyncio.StreamWriter):
+    workers = subscribers.get(room)
+    if workers is not None:
+        workers.discard(writer)
+        if not workers:
+            del subscribers[room]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Gateway broadcast broker")
+    parser.add_argument("--path", default=BUS_PATH)
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        os.unlink(args.path)  # left over from a previous run
+    server = await asyncio.start_unix_server(handle_worker, path=args.path, limit=2 ** 20)
+    print(f"Broker listening on {args.path}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,120 @@
+# gateway/bus.py
+# Broadcast bus: how a room message reaches players connected to *other* gateway workers.
+#   BUS=memory (default) - one gateway process, messages never leave it
+#   BUS=unix             - several workers share a broker (python -m gateway.broker)
+#                          over a Unix socket at BUS_PATH
+# Each worker delivers to its own sockets directly and sends the message to the
+# broker, which forwards it to every other worker with players in that room.
+import asyncio
+import os
+from typing import Callable, Set
+
+BUS = os.environ.get("BUS", "memory")
+BUS_PATH = os.environ.get("BUS_PATH", "/tmp/prime-challenge-bus.sock")
+
+
+def valid_room(room_id: str) -> bool:
+    """Room IDs travel inside a line-based protocol, so no spaces or newlines"""
+    return bool(room_id) and not any(c.isspace() for c in room_id)
+
+
+class LocalBus:
+    """Single-process bus: publish goes straight to this worker's sockets"""
+
+    def __init__(self):
+        self.deliver: Callable[[str, str], None] = None
+
+    async def start(self, deliver: Callable[[str, str], None]):
+        """deliver(room_id, payload) sends to this worker's sockets in the room"""
+        self.deliver = deliver
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, room_id: str):
+        """This worker now has a player in the room"""
+
+    def unsubscribe(self, room_id: str):
+        """This worker has no players left in the room"""
+
+    def publish(self, room_id: str, payload: str):
+        self.deliver(room_id, payload)
+
+
+class UnixSocketBus(LocalBus):
+    """Bus shared by several workers through the broker in gateway/broker.py.
+
+    Line protocol (one message per line):
+        S <room>            subscribe
+        U <room>            unsubscribe
+        P <room> <payload>  publish (payload is the JSON text of the message)
+    If the broker goes away the worker keeps serving its own sockets and
+    reconnects (and re-subscribes) in the background.
+    """
+
+    def __init__(self, path: str = BUS_PATH):
+        super().__init__()
+        self.path = path
+        self.rooms: Set[str] = set()
+        self.writer: asyncio.StreamWriter = None
+        self.task = None
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.writer:
+            self.writer.close()
+
+    def _send(self, line: str):
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(line.encode())
+
+    def subscribe(self, room_id: str):
+        if valid_room(room_id):
+            self.rooms.add(room_id)
+            self._send(f"S {room_id}\n")
+
+    def unsubscribe(self, room_id: str):
+        if room_id in self.rooms:
+            self.rooms.discard(room_id)
+            self._send(f"U {room_id}\n")
+
+    def publish(self, room_id: str, payload: str):
+        self.deliver(room_id, payload)
+        if valid_room(room_id):
+            self._send(f"P {room_id} {payload}\n")
+
+    async def _run(self):
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.path, limit=2 ** 20)
+                # Tell the (possibly restarted) broker which rooms we care about
+                self.writer.write("".join(f"S {room_id}\n" for room_id in self.rooms).encode())
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    op, room_id, payload = line.decode().rstrip("\n").split(" ", 2)
+                    if op == "P":
+                        self.deliver(room_id, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Bus connection to {self.path} failed: {e}")
+            self.writer = None
+            await asyncio.sleep(1)
+
+
+def make_bus(kind: str = BUS):
+    if kind == "unix":
+        return UnixSocketBus()
+    if kind == "memory":
+        return LocalBus()
+    raise ValueError(f"Unknown bus: {kind}")
+
+
+bus = make_bus()
@@ -0,0 +1,90 @@
+# gateway/codec.py
+# WebSocket message encodings. A client picks one in its "auth" message:
+#   {"type": "auth", "token": "...", "encoding": "compact"}
+#   json    (default) - {"type": "update", "sum": 11, "turn": "bob", "seq": 5}
+#   compact           - [4,11,"bob",5]: a numeric type code followed by the fields
+#                       in a fixed order (see MESSAGES), in both directions
+# Compact frames are still JSON text, so any client can read them with its
+# normal JSON parser. Fields a message has beyond its fixed ones (or a type
+# without a code) are sent as a trailing object after all the fixed fields
+# (missing ones as null): [22,"R0",{"id":7}], [25,null,{"id":8}].
+import json
+from typing import Dict, List, Tuple
+
+ENCODINGS = ("json", "compact")
+
+# type -> (code, fields in order)
+MESSAGES: Dict[str, Tuple[int, List[str]]] = {
+    # Gateway -> client
+    "logged_in": (1, ["username"]),
+    "room_created": (2, ["room_id"]),
+    "game_start": (3, ["turn", "seq"]),
+    "update": (4, ["sum", "turn", "seq"]),
+    "game_over": (5, ["winner", "seq"]),
+    "game_restarted": (6, ["turn", "seq"]),
+    "error": (7, ["message"]),
+    "queued": (8, ["room_id"]),
+    "ok": (9, ["id"]),
+    "tournament_over": (10, ["tournament_id", "champion"]),
+    "resumed": (11, ["room_id", "seq"]),
+    # Client -> gateway
+    "auth": (20, ["token"]),
+    "create_room": (21, []),
+    "join_room": (22, ["room_id"]),
+    "move": (23, ["prime"]),
+    "restart_game": (24, []),
+    "quickmatch": (25, ["bucket"]),
+    "add_bot": (26, ["strategy"]),
+    "resume": (27, ["room_id", "seq"]),
+}
+TYPES = {code: (name, fields) for name, (code, fields) in MESSAGES.items()}
+
+
+def to_compact(message: dict) -> str:
+    known = MESSAGES.get(message.get("type"))
+    if known is None:
+        return json.dumps(message, separators=(",", ":"))
+    code, fields = known
+    frame = [code]
+    for field in fields:
+        frame.append(message.get(field))
+    extra = {k: v for k, v in message.items() if k != "type" and k not in fields}
+    if extra:
+        # Every fixed field stays (null if missing), so the object is always after them
+        frame.append(extra)
+    else:
+        # Drop trailing missing fields: [25] instead of [25,null]
+        while len(frame) > 1 and frame[-1] is None and fields[len(frame) - 2] not in message:
+            frame.pop()
+    return json.dumps(frame, separators=(",", ":"))
+
+
+def from_compact(frame: list) -> dict:
+    name, fields = TYPES[frame[0]]
+    message = {"type": name}
+    values = frame[1:]
+    if values and isinstance(values[-1], dict) and len(values) > len(fields):
+        message.update(values.pop())
+    message.update(zip(fields, values))
+    return message
+
+
+def encode(message: dict, encoding: str = "json") -> str:
+    if encoding == "compact":
+        return to_compact(message)
+    return json.dumps(message)
+
+
+def reencode(payload: str, encoding: str) -> str:
+    """A JSON-encoded message in another encoding"""
+    if encoding == "json":
+        return payload
+    return encode(json.loads(payload), encoding)
+
+
+def decode(data: str) -> dict:
+    """A frame from a client, in either encoding; raises ValueError/KeyError if malformed"""
+    message = json.loads(data)
+    if isinstance(message, list):
+        return from_compact(message)
+    return message
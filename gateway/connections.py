@@ -0,0 +1,212 @@
+# gateway/connections.py
+# Who is online, which room they are in, and how messages reach their sockets.
+import asyncio
+import collections
+import json
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+from gateway.bus import bus
+from gateway.codec import encode, reencode
+from shared.metrics import registry
+
+SEND_QUEUE_SIZE = int(os.environ.get("WS_SEND_QUEUE", "64"))    # pending frames per socket
+SEND_TIMEOUT = float(os.environ.get("WS_SEND_TIMEOUT", "2"))    # seconds for one frame
+RESUME_GRACE = float(os.environ.get("WS_RESUME_GRACE", "30"))   # seconds a disconnected player keeps their room
+ROOM_EVENT_BUFFER = int(os.environ.get("ROOM_EVENT_BUFFER", "32"))  # recent events kept per room for resuming
+
+
+ws_sent = registry.counter("ws_messages_sent_total", "Frames queued to player sockets")
+ws_dropped = registry.counter("ws_slow_clients_dropped_total", "Sockets dropped for not keeping up")
+
+
+class PlayerConnection:
+    """A player's WebSocket with its own bounded send queue.
+
+    A writer task sends queued frames one by one. If the queue fills up or a
+    frame takes longer than SEND_TIMEOUT, the client is too slow and is dropped,
+    so it never holds up the other players in the room.
+    """
+
+    def __init__(self, ws: WebSocket, username: str = None):
+        self.ws = ws
+        self.username = username
+        self.address = ws.client.host if ws.client else None  # for limits before logging in
+        self.encoding = "json"  # chosen by the client in "auth" (gateway/codec.py)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.closed = False
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def send_text(self, payload: str):
+        """Queue a frame without waiting for the socket"""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(payload)
+            ws_sent.inc()
+        except asyncio.QueueFull:
+            self.drop()
+
+    def send_json(self, message: dict):
+        self.send_text(encode(message, self.encoding))
+
+    async def _write_loop(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                await asyncio.wait_for(self.ws.send_text(payload), SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Timeout or broken socket
+            self.drop()
+
+    def drop(self):
+        """Stop sending to this client; it can resume once it reconnects"""
+        if self.closed:
+            return
+        self.closed = True
+        ws_dropped.inc()
+        self.writer.cancel()
+        if self.username and connected_players.get(self.username) is self:
+            del connected_players[self.username]  # its room is kept (detach_player)
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(self.ws.close(), SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def close(self):
+        """Normal disconnect: stop the writer"""
+        self.closed = True
+        self.writer.cancel()
+
+
+class RoomEvents:
+    """The last ROOM_EVENT_BUFFER broadcasts of a room, numbered, for players who reconnect"""
+
+    def __init__(self, size: int = ROOM_EVENT_BUFFER):
+        self.seq = 0
+        self.events: collections.deque = collections.deque(maxlen=size)  # (seq, payload)
+
+    def append(self, payload: str) -> str:
+        """Number a JSON-encoded message; returns it with its "seq" field"""
+        self.seq += 1
+        payload = f'{payload[:-1]}, "seq": {self.seq}}}'  # payload is a json.dumps'd object
+        self.events.append((self.seq, payload))
+        return payload
+
+    def since(self, seq: int) -> Optional[List[str]]:
+        """Events after seq, or None if some of them are no longer kept"""
+        if seq > self.seq:
+            return None  # numbered by another worker (or an earlier room)
+        if seq == self.seq:
+            return []
+        if not self.events or self.events[0][0] > seq + 1:
+            return None
+        return [payload for n, payload in self.events if n > seq]
+
+
+connected_players: Dict[str, PlayerConnection] = {}  # username -> connection
+player_rooms: Dict[str, str] = {}  # username -> room_id
+room_members: Dict[str, Set[str]] = {}  # room_id -> usernames (index for broadcasts)
+room_events: Dict[str, RoomEvents] = {}  # room_id -> recent broadcasts (same keys as room_members)
+detached: Dict[str, asyncio.Task] = {}  # username -> grace timer, while disconnected but still in a room
+
+registry.gauge("players_connected", "Logged-in players on this gateway", callback=lambda: len(connected_players))
+registry.gauge("players_detached", "Disconnected players whose room is kept for them", callback=lambda: len(detached))
+registry.gauge("rooms_active", "Rooms with players on this gateway", callback=lambda: len(room_members))
+
+
+def set_player_room(username: str, room_id: str):
+    """Put a player in a room (and take them out of their old one)"""
+    old_room = player_rooms.get(username)
+    if old_room == room_id:
+        return
+    if old_room is not None:
+        _leave_room(username, old_room)
+    player_rooms[username] = room_id
+    if room_id not in room_members:
+        room_members[room_id] = set()
+        room_events[room_id] = RoomEvents()
+        bus.subscribe(room_id)  # first player of this room on this worker
+    room_members[room_id].add(username)
+
+
+def _leave_room(username: str, room_id: str):
+    members = room_members.get(room_id)
+    if members is not None:
+        members.discard(username)
+        if not members:
+            del room_members[room_id]
+            del room_events[room_id]
+            bus.unsubscribe(room_id)
+
+
+def remove_player(username: str, conn: PlayerConnection = None):
+    """Forget a player on disconnect.
+
+    If conn is given, only remove the player when that is still their current
+    connection (a newer socket may have logged in with the same name).
+    """
+    if conn is not None and connected_players.get(username) is not conn:
+        return
+    connected_players.pop(username, None)
+    room_id = player_rooms.pop(username, None)
+    if room_id is not None:
+        _leave_room(username, room_id)
+
+
+def detach_player(username: str, conn: PlayerConnection, on_expire: Callable[[str], Awaitable]):
+    """A player's socket closed: keep their room for RESUME_GRACE seconds.
+
+    Their room's events keep being buffered; on_expire(username) runs if they
+    have not logged in again by then.
+    """
+    if connected_players.get(username) is conn:
+        del connected_players[username]
+    elif username in connected_players or username in detached:
+        return  # a newer socket took over (or already waiting for one)
+    if username not in player_rooms:
+        remove_player(username)
+        return
+
+    async def expire():
+        await asyncio.sleep(RESUME_GRACE)
+        del detached[username]
+        await on_expire(username)
+
+    detached[username] = asyncio.create_task(expire())
+
+
+def reattach_player(username: str):
+    """The player logged in again within the grace period: keep their room"""
+    timer = detached.pop(username, None)
+    if timer is not None:
+        timer.cancel()
+
+
+def deliver_local(room_id: str, payload: str):
+    """Number a JSON-encoded message and send it to the players of a room on this worker"""
+    events = room_events.get(room_id)
+    if events is None:
+        return  # nobody here (the bus only sends rooms we subscribed to)
+    payload = events.append(payload)
+    encoded = {"json": payload}  # re-encoded at most once per encoding, shared by all recipients
+    # Copy: a slow client may be dropped (and leave the room) while we loop
+    for username in tuple(room_members.get(room_id, ())):
+        conn = connected_players.get(username)
+        if conn is not None:
+            text = encoded.get(conn.encoding)
+            if text is None:
+                text = encoded[conn.encoding] = reencode(payload, conn.encoding)
+            conn.send_text(text)
+
+
+async def send_to_room(room_id: str, message: dict):
+    """Send message to all players in a room (on every gateway worker)"""
+    bus.publish(room_id, json.dumps(message))  # encode once for every recipient
@@ -0,0 +1,103 @@
+# gateway/games.py
+# Where the gateway sends game actions. Chosen with GAME_MODE:
+#   remote   (default) - HTTP calls to the game service
+#   embedded           - run the game engine inside the gateway process (no network hop)
+# Both return (status, data) just like an HTTP call, so the WebSocket code does not care.
+import asyncio
+import os
+from typing import List
+
+from game_service.engine import GameEngine, GameError
+from gateway.upstream import upstream
+from shared.metrics import registry
+
+GAME_MODE = os.environ.get("GAME_MODE", "remote")
+
+
+class RemoteGames:
+    """Game actions over HTTP to game_service"""
+
+    def start_sweeper(self):
+        pass  # the game service evicts its own games
+
+    def stop_sweeper(self):
+        pass
+
+    async def start(self, room_id: str, players: List[str]):
+        return await upstream.call("game", "/start", {"room_id": room_id, "players": players})
+
+    async def move(self, room_id: str, username: str, prime: int):
+        return await upstream.call("game", "/move", {"room_id": room_id, "username": username, "prime": prime})
+
+    async def restart(self, room_id: str):
+        return await upstream.call("game", "/restart", {"room_id": room_id})
+
+    async def state(self, room_id: str):
+        return await upstream.call("game", "/state", {"room_id": room_id})
+
+    async def start_many(self, games: List[tuple]):
+        """Start many (room_id, players) games with one HTTP call"""
+        return await upstream.call("game", "/start_many", {"games": [
+            {"room_id": room_id, "players": players} for room_id, players in games
+        ]})
+
+    async def move_batch(self, moves: List[tuple]):
+        """Apply many (room_id, username, prime) moves with one HTTP call"""
+        status, data = await upstream.call("game", "/moves", {"moves": [
+            {"room_id": room_id, "username": username, "prime": prime} for room_id, username, prime in moves
+        ]})
+        if status != 200:
+            return [(status, data)] * len(moves)
+        return [(r["status"], r["result"]) for r in data["results"]]
+
+
+class EmbeddedGames:
+    """Game actions on an in-process GameEngine"""
+
+    def __init__(self):
+        self.engine = GameEngine()
+        self.sweeper = None
+
+    def start_sweeper(self, interval: float = 5):
+        """Evict finished/idle games in the background (the game service does the same)"""
+        async def sweep():
+            while True:
+                await asyncio.sleep(interval)
+                self.engine.sweep()
+        self.sweeper = asyncio.create_task(sweep())
+
+    def stop_sweeper(self):
+        if self.sweeper:
+            self.sweeper.cancel()
+
+    def _run(self, action, *args):
+        try:
+            return 200, action(*args)
+        except GameError as e:
+            return e.status_code, {"detail": e.detail}
+
+    async def start(self, room_id: str, players: List[str]):
+        return self._run(self.engine.start, room_id, players)
+
+    async def move(self, room_id: str, username: str, prime: int):
+        return self._run(self.engine.move, room_id, username, prime)
+
+    async def restart(self, room_id: str):
+        return self._run(self.engine.restart, room_id)
+
+    async def state(self, room_id: str):
+        return self._run(self.engine.state, room_id)
+
+    async def move_batch(self, moves: List[tuple]):
+        return [self._run(self.engine.move, *m) for m in moves]
+
+    async def start_many(self, games: List[tuple]):
+        for room_id, players in games:
+            self.engine.start(room_id, players)
+        return 200, {"started": len(games)}
+
+
+games = EmbeddedGames() if GAME_MODE == "embedded" else RemoteGames()
+
+if GAME_MODE == "embedded":
+    registry.gauge("games", "Games in the games table", callback=lambda: len(games.engine.games))
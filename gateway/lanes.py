@@ -0,0 +1,30 @@
+# gateway/lanes.py
+# Run work one at a time per key (e.g. per room) while different keys run concurrently.
+import asyncio
+from typing import Awaitable, Dict, Hashable
+
+
+class KeyedLanes:
+    """Serializes coroutines that share a key, in the order they were submitted"""
+
+    def __init__(self):
+        self.tails: Dict[Hashable, asyncio.Task] = {}  # key -> last submitted task
+
+    def submit(self, key: Hashable, work: Awaitable) -> asyncio.Task:
+        previous = self.tails.get(key)
+        task = asyncio.create_task(self._run(previous, work))
+        self.tails[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    async def _run(self, previous: asyncio.Task, work: Awaitable):
+        if previous is not None:
+            await asyncio.wait([previous])  # its result/exception belongs to its submitter
+        return await work
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self.tails.get(key) is task:
+            del self.tails[key]  # nothing queued behind it
+
+    def __len__(self):
+        return len(self.tails)
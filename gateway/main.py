@@ -1,14 +1,62 @@
 # gateway/main.py
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import asyncio
 import aiohttp
-import json
+import hmac
 import os
 
-app = FastAPI(title="API Gateway")
+from gateway.upstream import upstream, Overloaded
+from gateway.games import games
+from gateway.connections import (
+    PlayerConnection, connected_players, player_rooms, room_members, room_events, set_player_room, remove_player,
+    detach_player, reattach_player, send_to_room, deliver_local,
+)
+from gateway.bus import bus
+from gateway.codec import ENCODINGS, decode, reencode
+from gateway.lanes import KeyedLanes
+from gateway.bots import BotScheduler, STRATEGIES, BOT_TICK
+from gateway.sessions import sessions
+from gateway.matchmaking import QuickMatcher
+from gateway.tournaments import TournamentManager, KINDS
+from gateway.ratelimit import message_limits, room_limits, auth_limits, admin_limits
+from gateway.assets import StaticAsset, STATIC_RELOAD, watch
+from shared.metrics import instrument, registry
+from shared.state import StateBusy
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled upstream client for the whole gateway
+    await upstream.start()
+    await bus.start(deliver_local)
+    games.start_sweeper()
+    bots.start()
+    matcher.start()
+    watcher = asyncio.create_task(watch([index_page])) if STATIC_RELOAD == "on" else None
+    yield
+    if watcher:
+        watcher.cancel()
+    await matcher.stop()
+    await bots.stop()
+    games.stop_sweeper()
+    await bus.stop()
+    await upstream.close()
+
+app = FastAPI(title="API Gateway", lifespan=lifespan)
+instrument(app, "gateway")
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    # Shed load instead of queueing: the client should back off and retry
+    return JSONResponse(status_code=503, content={"detail": "Server busy, try again"})
+
+ws_connections = registry.gauge("ws_connections", "Open WebSocket connections")
+ws_received = registry.counter("ws_messages_received_total", "WebSocket messages from players", ["type"])
 
 # Add CORS middleware (though not needed if same origin, but good practice)
 app.add_middleware(
@@ -23,148 +71,462 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+# Read and compressed once; served from memory
+index_page = StaticAsset(os.path.join(STATIC_DIR, "index.html"), "text/html; charset=utf-8")
+
 @app.get("/")
-async def root():
-    with open(os.path.join(STATIC_DIR, "index.html"), "r", encoding="utf-8") as f:
-        return HTMLResponse(f.read())
+async def root(request: Request):
+    return index_page.response(request)
 
 # Pydantic models for authentication
 class UserData(BaseModel):
     username: str
     password: str
 
-USER_URL = "http://localhost:8001"
-ROOM_URL = "http://localhost:8002"
-GAME_URL = "http://localhost:8003"
-
-connected_players = {}  # username -> WebSocket
-player_rooms = {}  # username -> room_id
-
 # Authentication endpoints - proxy to user service
+def check_auth_rate(request: Request):
+    if not auth_limits.allow(request.client.host if request.client else None):
+        raise HTTPException(status_code=429, detail="Too many attempts, try again later")
+
 @app.post("/register")
-async def register(user: UserData):
+async def register(user: UserData, request: Request):
     """Register a new user through the gateway"""
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(f"{USER_URL}/register", json={"username": user.username, "password": user.password}) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data
-                else:
-                    error_data = await resp.json()
-                    raise HTTPException(status_code=resp.status, detail=error_data.get("detail", "Registration failed"))
-        except aiohttp.ClientError as e:
-            raise HTTPException(status_code=503, detail="User service unavailable")
+    check_auth_rate(request)
+    try:
+        status, data = await upstream.call("user", "/register", {"username": user.username, "password": user.password})
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        raise HTTPException(status_code=503, detail="User service unavailable")
+    if status != 200:
+        raise HTTPException(status_code=status, detail=data.get("detail", "Registration failed"))
+    return data
 
 @app.post("/login")
-async def login(user: UserData):
+async def login(user: UserData, request: Request):
     """Login through the gateway"""
-    async with aiohttp.ClientSession() as session:
+    check_auth_rate(request)
+    try:
+        status, data = await upstream.call("user", "/login", {"username": user.username, "password": user.password})
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        raise HTTPException(status_code=503, detail="User service unavailable")
+    if status != 200:
+        raise HTTPException(status_code=status, detail=data.get("detail", "Login failed"))
+    # Signed session token: send it in the WebSocket "auth" message instead of the password
+    return {**data, "token": sessions.issue(user.username), "expires_in": sessions.ttl}
+
+class LogoutData(BaseModel):
+    token: str
+
+@app.post("/logout")
+async def logout(req: LogoutData):
+    """Revoke a session token"""
+    try:
+        revoked = sessions.revoke(req.token)
+    except StateBusy:
+        raise HTTPException(status_code=503, detail="Server busy, try again")
+    if not revoked:
+        raise HTTPException(status_code=400, detail="Invalid token")
+    return {"message": "Logged out"}
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    """Connection pool usage per service (for sizing the pools)"""
+    return upstream.metrics()
+
+async def start_game(room_id: str, players: List[str]):
+    """Start the game in a full room and tell everyone in it"""
+    await games.start(room_id, players)
+    await announce_start(room_id, players)
+
+async def announce_start(room_id: str, players: List[str]):
+    """Tell a room its game has started (the game service already knows)"""
+    first_player = players[0]
+    # Track both players' rooms
+    for player in players:
+        if player in connected_players:
+            set_player_room(player, room_id)
+    # THESE TWO LINES ARE CRITICAL — UI switches only because of this
+    await send_to_room(room_id, {"type": "game_start", "turn": first_player})
+    await send_to_room(room_id, {"type": "update", "sum": 0, "turn": first_player})
+    bots.on_update(room_id, 0, first_player)
+
+async def announce_move(room_id: str, result: dict):
+    """Broadcast the result of a move (from a player or a bot)"""
+    if "winner" in result:
+        await send_to_room(room_id, {"type": "game_over", "winner": result["winner"]})
+        if tournaments.on_game_over(room_id, result["winner"]):
+            return  # the tournament closes its rooms a round at a time
+        if room_id not in room_members:
+            close_later(room_id)  # bot-only game is over
+    else:
+        await send_to_room(room_id, {"type": "update", "sum": result["sum"], "turn": result["turn"]})
+        bots.on_update(room_id, result["sum"], result["turn"])
+
+async def close_room(room_id: str):
+    """Nobody is left to play in a room: free it everywhere"""
+    bots.forget_room(room_id)
+    try:
+        await upstream.call("room", "/close", {"room_id": room_id})
+    except Exception:
+        pass  # the room service sweeper removes it later anyway
+
+# Finished bot-only rooms, freed with one /close_many per bot tick so the
+# bot scheduler never waits on the room service for each game
+rooms_to_close: List[str] = []
+closer: Optional[asyncio.Task] = None
+
+def close_later(room_id: str):
+    global closer
+    bots.forget_room(room_id)
+    rooms_to_close.append(room_id)
+    if closer is None or closer.done():
+        closer = asyncio.create_task(close_rooms())
+
+async def close_rooms():
+    while rooms_to_close:
+        await asyncio.sleep(BOT_TICK)  # the rest of the batch's finished games join in
+        room_ids = rooms_to_close[:]
+        rooms_to_close.clear()
         try:
-            async with session.post(f"{USER_URL}/login", json={"username": user.username, "password": user.password}) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data
-                else:
-                    error_data = await resp.json()
-                    raise HTTPException(status_code=resp.status, detail=error_data.get("detail", "Login failed"))
-        except aiohttp.ClientError as e:
-            raise HTTPException(status_code=503, detail="User service unavailable")
-
-async def send_to_room(room_id: str, message: dict):
-    """Send message to all players in a room"""
-    payload = json.dumps(message)
-    for username, ws in list(connected_players.items()):
-        if player_rooms.get(username) == room_id:
-            try:
-                await ws.send_text(payload)
-            except:
-                pass
+            await upstream.call("room", "/close_many", {"room_ids": room_ids})
+        except Exception:
+            pass  # the room service sweeper removes them later anyway
+
+# Players' actions and bot moves run one at a time per room, in arrival order
+room_lanes = KeyedLanes()
+registry.gauge("room_lanes", "Rooms with actions queued or running", callback=lambda: len(room_lanes))
+
+bots = BotScheduler(games, announce_move, room_lanes)
+matcher = QuickMatcher(start_game)
+tournaments = TournamentManager(games, bots, announce_start)
+
+# Bot games and tournaments create rooms and bots in bulk, so they are for operators:
+# with ADMIN_TOKEN set they need an X-Admin-Token header, otherwise they only
+# answer requests from this machine. Either way they are rate limited per address.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+MAX_BOT_GAMES = int(os.environ.get("MAX_BOT_GAMES", "10000"))                  # per request
+MAX_TOURNAMENT_PLAYERS = int(os.environ.get("MAX_TOURNAMENT_PLAYERS", "1024"))  # players + bots
+
+def check_admin(request: Request):
+    address = request.client.host if request.client else None
+    if ADMIN_TOKEN:
+        if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+            raise HTTPException(status_code=403, detail="Admin token required")
+    elif address not in ("127.0.0.1", "::1", "localhost"):
+        raise HTTPException(status_code=403, detail="Only allowed from localhost (or set ADMIN_TOKEN)")
+    if not admin_limits.allow(address):
+        raise HTTPException(status_code=429, detail="Too many requests, try again later")
+
+class BotGamesRequest(BaseModel):
+    count: int = 1
+    strategies: List[str] = ["random", "perfect"]
+
+async def start_bot_game(strategies: List[str]):
+    names = [bots.create_bot(strategy) for strategy in strategies]
+    _, room = await upstream.call("room", "/create", {"username": names[0]})
+    room_id = room["room_id"]
+    _, data = await upstream.call("room", "/join", {"room_id": room_id, "username": names[1]})
+    for name in names:
+        bots.add_to_room(room_id, name)
+    await start_game(room_id, data["players"])
+
+@app.post("/bots/games")
+async def bot_games(req: BotGamesRequest, request: Request):
+    """Start bot-vs-bot games (for load and regression testing)"""
+    check_admin(request)
+    if not 1 <= req.count <= MAX_BOT_GAMES:
+        raise HTTPException(status_code=400, detail=f"count must be 1 to {MAX_BOT_GAMES}")
+    if len(req.strategies) != 2:
+        raise HTTPException(status_code=400, detail="Need two strategies")
+    for strategy in req.strategies:
+        if strategy not in STRATEGIES:
+            raise HTTPException(status_code=400, detail=f"Unknown strategy! Use: {list(STRATEGIES)}")
+    for i in range(0, req.count, 100):
+        await asyncio.gather(*(start_bot_game(req.strategies) for _ in range(min(100, req.count - i))))
+    return {"started": req.count}
+
+class TournamentRequest(BaseModel):
+    kind: str = "single_elimination"  # or "round_robin"
+    players: List[str] = []           # registered players, connected when their round starts
+    bots: int = 0                     # extra bot entrants
+    bot_strategy: str = "random"
+
+@app.post("/tournaments")
+async def create_tournament(req: TournamentRequest, request: Request):
+    """Start a tournament; its rounds are created and advanced automatically"""
+    check_admin(request)
+    if req.bots < 0 or len(req.players) + req.bots > MAX_TOURNAMENT_PLAYERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_TOURNAMENT_PLAYERS} players and bots")
+    if req.kind not in KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown tournament kind! Use: {list(KINDS)}")
+    if req.bots and req.bot_strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy! Use: {list(STRATEGIES)}")
+    if len(set(req.players)) != len(req.players) or len(req.players) + req.bots < 2:
+        raise HTTPException(status_code=400, detail="Need at least two different players")
+    entrants = req.players + [bots.create_bot(req.bot_strategy) for _ in range(req.bots)]
+    tournament = await tournaments.create(req.kind, entrants)
+    return tournament.to_dict()
+
+@app.get("/tournaments/{tournament_id}")
+async def tournament_status(tournament_id: str):
+    tournament = tournaments.tournaments.get(tournament_id)
+    if tournament is None:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    return tournament.to_dict()
+
+@app.get("/bots/stats")
+async def bot_stats():
+    return {**bots.stats, "bots": len(bots.bots), "rooms": len(bots.room_bots), "pending": len(bots.pending)}
+
+# Messages that change who/where the player is run in order on their connection;
+# room actions run in order per room, so moves in one game stay serialized.
+SESSION_TYPES = {"auth", "resume", "create_room", "join_room", "quickmatch"}
+ROOM_TYPES = {"add_bot", "restart_game", "move"}
+CREATING_TYPES = {"create_room", "quickmatch", "add_bot"}  # each one makes a room (or a bot) that lives on
+WS_TYPES = SESSION_TYPES | ROOM_TYPES
+PIPELINE_DEPTH = int(os.environ.get("WS_PIPELINE_DEPTH", "32"))  # unanswered messages per socket
+MAX_BUCKET_LENGTH = 64  # quick-match bucket names (e.g. "eu", "beginner")
+
+def reply(conn: PlayerConnection, msg: dict, message: dict):
+    """Answer the sender of msg, echoing its request "id" if it sent one"""
+    if "id" in msg:
+        message["id"] = msg["id"]
+    conn.send_json(message)
+
+def acknowledge(conn: PlayerConnection, msg: dict):
+    """Room broadcasts are shared frames, so a request with an id also gets its own "ok" """
+    if "id" in msg:
+        conn.send_json({"type": "ok", "id": msg["id"]})
+
+async def handle_session(conn: PlayerConnection, msg: dict):
+    if msg["type"] == "auth":
+        encoding = msg.get("encoding", "json")
+        if encoding not in ENCODINGS:
+            reply(conn, msg, {"type": "error", "message": f"Unknown encoding! Use: {list(ENCODINGS)}"})
+            return
+        if msg.get("token") is not None:  # a compact auth frame always has the slot, null for a password login
+            # Checked locally, no user service call
+            username = sessions.verify(msg["token"])
+            if username is None:
+                reply(conn, msg, {"type": "error", "message": "Invalid or expired session"})
+                return
+        else:
+            username = msg["username"]
+            password = msg["password"]
+            credentials = {"username": username, "password": password}
+            # New names are registered on the fly; a taken name just fails here (400)
+            await upstream.call("user", "/register", credentials)
+            status, data = await upstream.call("user", "/login", credentials)
+            if status != 200:
+                reply(conn, msg, {"type": "error", "message": data.get("detail", "Login failed")})
+                return
+        if conn.username and conn.username != username:
+            remove_player(conn.username, conn)  # same socket, new name
+        conn.username = username
+        conn.encoding = encoding
+        connected_players[username] = conn
+        reattach_player(username)  # back within the grace period: still in their room
+        reply(conn, msg, {"type": "logged_in", "username": username})
+        return
+
+    username = conn.username
+    if username is None:
+        reply(conn, msg, {"type": "error", "message": "Not logged in"})
+
+    elif msg["type"] == "create_room":
+        _, room = await upstream.call("room", "/create", {"username": username})
+        room_id = room["room_id"]
+        set_player_room(username, room_id)  # Track player's room
+        reply(conn, msg, {"type": "room_created", "room_id": room_id})
+
+    elif msg["type"] == "join_room":
+        room_id = msg["room_id"]
+        status, data = await upstream.call("room", "/join", {"room_id": room_id, "username": username})
+        if status != 200:
+            reply(conn, msg, {"type": "error", "message": "Cannot join room"})
+            return
+        set_player_room(username, room_id)  # Track player's room
+        acknowledge(conn, msg)
+
+        if len(data["players"]) == 2:
+            # Serialized with the room's other actions
+            await room_lanes.submit(room_id, start_game(room_id, data["players"]))
+
+    elif msg["type"] == "quickmatch":
+        # Play the next player who is also looking (optionally within a bucket)
+        bucket = msg.get("bucket")
+        if bucket is not None and (not isinstance(bucket, str) or len(bucket) > MAX_BUCKET_LENGTH):
+            # One bad entry would make the room service refuse the whole batch
+            reply(conn, msg, {"type": "error", "message": "Bad bucket"})
+            return
+        if not matcher.request(username, bucket):
+            reply(conn, msg, {"type": "error", "message": "Already looking for an opponent"})
+            return
+        acknowledge(conn, msg)
+
+    elif msg["type"] == "resume":
+        # Reconnected: catch up on the room without re-joining
+        room_id = msg.get("room_id") or player_rooms.get(username)
+        if not room_id:
+            reply(conn, msg, {"type": "error", "message": "Nothing to resume"})
+            return
+        await room_lanes.submit(room_id, resume_room(conn, msg, room_id))
+
+async def resume_room(conn: PlayerConnection, msg: dict, room_id: str):
+    """Send the room events the player missed, or the game as it is now"""
+    username = conn.username
+    events = room_events.get(room_id) if player_rooms.get(username) == room_id else None
+    missed = events.since(msg["seq"]) if events is not None and msg.get("seq") is not None else None
+    if missed is not None:
+        for payload in missed:
+            conn.send_text(reencode(payload, conn.encoding))
+        reply(conn, msg, {"type": "resumed", "room_id": room_id, "seq": events.seq, "missed": len(missed)})
+        return
+
+    # Too far behind, or the room was on another gateway worker: send a snapshot
+    status, game = await games.state(room_id)
+    if status == 200:
+        allowed = username in game["players"]
+    else:
+        allowed = player_rooms.get(username) == room_id  # still waiting for an opponent
+    if not allowed:
+        reply(conn, msg, {"type": "error", "message": "Cannot resume"})
+        return
+    set_player_room(username, room_id)
+    snapshot = {"type": "resumed", "room_id": room_id, "seq": room_events[room_id].seq}
+    if status == 200:
+        snapshot.update(sum=game["sum"], turn=game["turn"], winner=game["winner"])
+    reply(conn, msg, snapshot)
+
+async def handle_room(conn: PlayerConnection, room_id: str, msg: dict):
+    username = conn.username
+    if msg["type"] == "add_bot":
+        # Fill the player's waiting room with a bot opponent
+        try:
+            bot = bots.create_bot(msg.get("strategy", "perfect"))
+        except ValueError as e:
+            reply(conn, msg, {"type": "error", "message": str(e)})
+            return
+        status, data = await upstream.call("room", "/join", {"room_id": room_id, "username": bot})
+        if status != 200:
+            bots.remove_bot(bot)
+            reply(conn, msg, {"type": "error", "message": "Cannot add bot"})
+            return
+        bots.add_to_room(room_id, bot)
+        acknowledge(conn, msg)
+        if len(data["players"]) == 2:
+            await start_game(room_id, data["players"])
+
+    elif msg["type"] == "restart_game":
+        status, result = await games.restart(room_id)
+        if status == 200:
+            first_player = result["turn"]
+            bots.restarted(room_id)  # bot moves still in flight belong to the old game
+            acknowledge(conn, msg)
+            # Notify both players that game restarted
+            await send_to_room(room_id, {"type": "game_restarted", "turn": first_player})
+            await send_to_room(room_id, {"type": "update", "sum": 0, "turn": first_player})
+            bots.on_update(room_id, 0, first_player)
+        else:
+            reply(conn, msg, {"type": "error", "message": "Cannot restart game"})
+
+    elif msg["type"] == "move":
+        status, result = await games.move(room_id, username, msg["prime"])
+        if status != 200:
+            reply(conn, msg, {"type": "error", "message": result.get("detail", "Move failed")})
+            return
+        acknowledge(conn, msg)
+        await announce_move(room_id, result)
+
+async def run_safely(conn: PlayerConnection, msg: dict, work):
+    """Turn a failed action into an error frame instead of closing the socket"""
+    try:
+        await work
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        reply(conn, msg, {"type": "error", "message": "Service unavailable"})
+    except Overloaded:
+        reply(conn, msg, {"type": "error", "message": "Server busy, try again"})
+    except (KeyError, TypeError, ValueError):
+        reply(conn, msg, {"type": "error", "message": "Bad request"})
+    except Exception as e:
+        print(f"{msg.get('type')} failed for {conn.username}: {e!r}")
+        reply(conn, msg, {"type": "error", "message": "Request failed"})
+
+async def process_messages(conn: PlayerConnection, inbox: asyncio.Queue):
+    """Handle one socket's messages in the order they arrived.
+
+    Session messages are awaited here; room actions are handed to the room's
+    lane, so the next message is read while a move is still in flight.
+    """
+    in_flight = asyncio.Semaphore(PIPELINE_DEPTH)
+
+    async def run_in_room(msg: dict, room_id: str):
+        try:
+            await run_safely(conn, msg, handle_room(conn, room_id, msg))
+        finally:
+            in_flight.release()
+
+    while True:
+        msg = await inbox.get()
+        if msg.get("type") in ROOM_TYPES:
+            room_id = player_rooms.get(conn.username) if conn.username else None
+            if not room_id:
+                reply(conn, msg, {"type": "error", "message": "Not in a room"})
+                continue
+            await in_flight.acquire()
+            room_lanes.submit(room_id, run_in_room(msg, room_id))
+        elif msg.get("type") in SESSION_TYPES:
+            await run_safely(conn, msg, handle_session(conn, msg))
+        else:
+            reply(conn, msg, {"type": "error", "message": "Unknown message type"})
+
+def allowed(conn: PlayerConnection, msg: dict) -> bool:
+    """Rate limits per player (per address before logging in)"""
+    key = conn.username or conn.address
+    if not message_limits.allow(key):
+        return False
+    if msg.get("type") in CREATING_TYPES:
+        return room_limits.allow(key)
+    if msg.get("type") == "auth" and msg.get("token") is None:
+        return auth_limits.allow(conn.address)  # password check on the user service
+    return True
 
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     await ws.accept()
-    username = None
-    room_id = None
+    conn = PlayerConnection(ws)
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+    processor = asyncio.create_task(process_messages(conn, inbox))
+    ws_connections.inc()
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            while True:
-                data = await ws.receive_text()
-                msg = json.loads(data)
-
-                if msg["type"] == "auth":
-                    username = msg["username"]
-                    password = msg["password"]
-                    try:
-                        await session.post(f"{USER_URL}/register", json={"username": username, "password": password})
-                    except: pass
-                    await session.post(f"{USER_URL}/login", json={"username": username, "password": password})
-                    connected_players[username] = ws
-                    await ws.send_json({"type": "logged_in", "username": username})
-
-                elif msg["type"] == "create_room":
-                    resp = await session.post(f"{ROOM_URL}/create", json={"username": username})
-                    room = await resp.json()
-                    room_id = room["room_id"]
-                    player_rooms[username] = room_id  # Track player's room
-                    await ws.send_json({"type": "room_created", "room_id": room_id})
-
-                elif msg["type"] == "join_room":
-                    room_id = msg["room_id"]
-                    player_rooms[username] = room_id  # Track player's room
-                    resp = await session.post(f"{ROOM_URL}/join", json={"room_id": room_id, "username": username})
-                    if resp.status != 200:
-                        await ws.send_json({"type": "error", "message": "Cannot join room"})
-                        continue
-                    data = await resp.json()
-
-                    if len(data["players"]) == 2:
-                        first_player = data["players"][0]
-                        # Track both players' rooms
-                        for player in data["players"]:
-                            if player in connected_players:
-                                player_rooms[player] = room_id
-                        await session.post(f"{GAME_URL}/start", json={"room_id": room_id, "players": data["players"]})
-                        # THESE TWO LINES ARE CRITICAL — UI switches only because of this
-                        await send_to_room(room_id, {"type": "game_start", "turn": first_player})
-                        await send_to_room(room_id, {"type": "update", "sum": 0, "turn": first_player})
-
-                elif msg["type"] == "restart_game":
-                    # Get room_id from tracked rooms (more reliable than local variable)
-                    current_room = player_rooms.get(username)
-                    if not current_room:
-                        await ws.send_json({"type": "error", "message": "Not in a room"})
-                        continue
-                    room_id = current_room  # Update local variable too
-                    resp = await session.post(f"{GAME_URL}/restart", json={"room_id": room_id})
-                    if resp.status == 200:
-                        result = await resp.json()
-                        first_player = result["turn"]
-                        # Notify both players that game restarted
-                        await send_to_room(room_id, {"type": "game_restarted", "turn": first_player})
-                        await send_to_room(room_id, {"type": "update", "sum": 0, "turn": first_player})
-                    else:
-                        await ws.send_json({"type": "error", "message": "Cannot restart game"})
-
-                elif msg["type"] == "move":
-                    # Get room_id from tracked rooms (more reliable)
-                    current_room = player_rooms.get(username) or room_id
-                    if not current_room:
-                        await ws.send_json({"type": "error", "message": "Not in a room"})
-                        continue
-                    room_id = current_room  # Update local variable
-                    resp = await session.post(f"{GAME_URL}/move", json={
-                        "room_id": room_id, "username": username, "prime": msg["prime"]
-                    })
-                    result = await resp.json()
-                    if "winner" in result:
-                        await send_to_room(room_id, {"type": "game_over", "winner": result["winner"]})
-                    else:
-                        await send_to_room(room_id, {"type": "update", "sum": result["sum"], "turn": result["turn"]})
-
-        except WebSocketDisconnect:
-            if username in connected_players:
-                del connected_players[username]
-            if username in player_rooms:
-                del player_rooms[username]
\ No newline at end of file
+    try:
+        while True:
+            data = await ws.receive_text()
+            try:
+                msg = decode(data)
+            except (KeyError, TypeError, ValueError, IndexError):
+                conn.send_json({"type": "error", "message": "Bad message"})
+                continue
+            if not isinstance(msg, dict):
+                conn.send_json({"type": "error", "message": "Bad message"})
+                continue
+            ws_received.inc(msg["type"] if msg.get("type") in WS_TYPES else "other")
+            if not allowed(conn, msg):
+                reply(conn, msg, {"type": "error", "message": "Too many requests, slow down"})
+                continue
+            await inbox.put(msg)  # waits (stops reading) when the player has too much in flight
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ws_connections.dec()
+        processor.cancel()
+        conn.close()
+        if conn.username:
+            detach_player(conn.username, conn, expire_player)  # kept for WS_RESUME_GRACE seconds
+
+async def expire_player(username: str):
+    """A disconnected player did not come back in time"""
+    left_room = player_rooms.get(username)
+    remove_player(username)
+    if left_room and left_room not in room_members:
+        await close_room(left_room)  # no humans left in the room
@@ -0,0 +1,105 @@
+# gateway/matchmaking.py
+# Quick-match: players ask for "any opponent". Requests from all sockets are
+# collected for a short tick and sent to the room service /quickmatch as one batch.
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+from gateway.upstream import upstream
+from gateway.connections import connected_players, player_rooms, set_player_room
+
+MATCH_TICK = float(os.environ.get("MATCH_TICK", "0.05"))     # seconds to collect a batch
+MATCH_BATCH_SIZE = int(os.environ.get("MATCH_BATCH_SIZE", "500"))
+
+
+class QuickMatcher:
+    """Batches quick-match requests and starts a game for every pair found"""
+
+    def __init__(self, on_match, tick: float = MATCH_TICK, batch_size: int = MATCH_BATCH_SIZE):
+        self.on_match = on_match  # async (room_id, players) -> None, starts the game
+        self.tick = tick
+        self.batch_size = batch_size
+        self.pending: List[dict] = []
+        # Players looking for an opponent: username -> their waiting room (None until the room service answers)
+        self.searching: Dict[str, Optional[str]] = {}
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def request(self, username: str, bucket: Optional[str] = None) -> bool:
+        """Queue a player; False if they are already looking (a double tap or a retry)"""
+        if username in self.searching:
+            room_id = self.searching[username]
+            if room_id is None or player_rooms.get(username) == room_id:
+                return False
+            del self.searching[username]  # matched elsewhere, left, or disconnected since
+        self.searching[username] = None
+        self.pending.append({"username": username, "bucket": bucket})
+        self.wakeup.set()
+        return True
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            await asyncio.sleep(self.tick)
+            self._forget_stale()
+            while self.pending:
+                batch = self.pending[:self.batch_size]
+                del self.pending[:self.batch_size]
+                await self._send(batch)
+
+    def _forget_stale(self):
+        """Drop players who are no longer in the room they were waiting in"""
+        stale = [username for username, room_id in self.searching.items()
+                 if room_id is not None and player_rooms.get(username) != room_id]
+        for username in stale:
+            del self.searching[username]
+
+    async def _send(self, batch: List[dict]):
+        try:
+            status, data = await upstream.call("room", "/quickmatch", {"players": batch})
+        except Exception:
+            status, data = 503, {}
+        if status != 200:
+            for entry in batch:
+                self.searching.pop(entry["username"], None)
+                conn = connected_players.get(entry["username"])
+                if conn is not None:
+                    conn.send_json({"type": "error", "message": "Matchmaking unavailable"})
+            return
+
+        for result in data["results"]:
+            if "error" in result:
+                # Only this player was not placed (the room service was busy): they can ask again
+                self.searching.pop(result["username"], None)
+                conn = connected_players.get(result["username"])
+                if conn is not None:
+                    conn.send_json({"type": "error", "message": result["error"]})
+                continue
+            username, room_id = result["username"], result["room_id"]
+            if username in connected_players:
+                set_player_room(username, room_id)
+            if result["matched"]:
+                for player in result["players"]:
+                    self.searching.pop(player, None)
+                try:
+                    await self.on_match(room_id, result["players"])
+                except Exception as e:
+                    print(f"Quick-match start failed for {room_id}: {e}")
+            else:
+                if username in self.searching:
+                    self.searching[username] = room_id
+                conn = connected_players.get(username)
+                if conn is not None:
+                    conn.send_json({"type": "queued", "room_id": room_id})
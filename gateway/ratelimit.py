@@ -0,0 +1,75 @@
+# gateway/ratelimit.py
+# Token buckets that limit how fast one player (or one IP address) may act.
+# A bucket holds up to `burst` tokens and refills at `rate` tokens per second;
+# each action takes a token, and an action with no token left is refused.
+import os
+import time
+from typing import Dict, Hashable, Tuple
+
+from shared.metrics import registry
+
+# Rates are per second; 0 turns a limit off (e.g. for load tests from one machine)
+WS_MESSAGE_RATE = float(os.environ.get("WS_MESSAGE_RATE", "20"))    # WebSocket frames per player
+WS_MESSAGE_BURST = float(os.environ.get("WS_MESSAGE_BURST", "40"))
+ROOM_CREATE_RATE = float(os.environ.get("ROOM_CREATE_RATE", "0.5"))  # create_room/quickmatch/add_bot per player
+ROOM_CREATE_BURST = float(os.environ.get("ROOM_CREATE_BURST", "5"))
+AUTH_RATE = float(os.environ.get("AUTH_RATE", "1"))                 # /register, /login, password auth per IP
+AUTH_BURST = float(os.environ.get("AUTH_BURST", "10"))
+ADMIN_RATE = float(os.environ.get("ADMIN_RATE", "1"))               # /bots/games, /tournaments per IP
+ADMIN_BURST = float(os.environ.get("ADMIN_BURST", "5"))
+
+rate_limited = registry.counter("rate_limited_total", "Requests refused by a rate limit", ["limit"])
+
+
+class TokenBucketLimiter:
+    """One token bucket per key (username or IP), kept only while the key is active.
+
+    A bucket left alone for burst / rate seconds is full again, which is the
+    same as having no bucket, so it is dropped. Buckets are kept in the order
+    they were last used, so the idle ones are always at the front.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.idle_after = burst / rate if rate > 0 else 0
+        self.buckets: Dict[Hashable, Tuple[float, float]] = {}  # key -> (tokens, last used), oldest first
+
+    def allow(self, key: Hashable, cost: float = 1) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        bucket = self.buckets.pop(key, None)  # re-added below, at the end
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now)
+        self._evict(now)
+        if not allowed:
+            rate_limited.inc(self.name)
+        return allowed
+
+    def _evict(self, now: float):
+        """Drop the least recently used bucket if it is full again (one per call keeps allow() O(1))"""
+        oldest = next(iter(self.buckets))
+        if now - self.buckets[oldest][1] >= self.idle_after:
+            del self.buckets[oldest]
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+message_limits = TokenBucketLimiter("ws_message", WS_MESSAGE_RATE, WS_MESSAGE_BURST)
+room_limits = TokenBucketLimiter("room_create", ROOM_CREATE_RATE, ROOM_CREATE_BURST)
+auth_limits = TokenBucketLimiter("auth", AUTH_RATE, AUTH_BURST)
+admin_limits = TokenBucketLimiter("admin", ADMIN_RATE, ADMIN_BURST)
+
+registry.gauge(
+    "rate_limit_keys", "Players/IPs with a token bucket", ["limit"],
+    callback=lambda: {(l.name,): len(l) for l in (message_limits, room_limits, auth_limits, admin_limits)},
+)
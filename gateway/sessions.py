@@ -0,0 +1,122 @@
+# gateway/sessions.py
+# Signed session tokens. /login hands one out; the WebSocket "auth" message can
+# send it back, and the gateway checks it locally instead of calling the user service.
+#
+# Token = base64(payload) + "." + base64(HMAC-SHA256(payload))
+# payload = {"u": username, "exp": unix time, "jti": random id}
+#
+# The signing secret is SESSION_SECRET if set. Otherwise it is generated once and
+# kept in SESSION_SECRET_FILE, so every worker on this machine shares it and
+# tokens survive restarts. Gateways on several machines need the same SESSION_SECRET.
+#
+# Logged-out tokens are remembered (jti -> expiry) in a SQLite file next to it,
+# SESSION_DB, so a revoked token is refused by every worker and after restarts.
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from typing import Optional
+
+from shared.state import SqliteStateStore
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SESSION_SECRET_FILE = os.environ.get("SESSION_SECRET_FILE", os.path.join(BASE_DIR, "session.key"))
+SESSION_DB = os.environ.get("SESSION_DB", os.path.join(BASE_DIR, "sessions.db"))
+PURGE_INTERVAL = 60  # seconds between sweeps of expired revocations
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(12 * 3600)))  # seconds
+
+
+def load_secret(path: str = SESSION_SECRET_FILE) -> bytes:
+    """SESSION_SECRET, or the secret in path (created on first use)"""
+    configured = os.environ.get("SESSION_SECRET", "")
+    if configured:
+        return configured.encode()
+    try:
+        with open(path, "rb") as f:
+            secret = f.read()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+    # Written under a temporary name and linked into place, so when several
+    # workers start at once exactly one secret wins and the others read it
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(secrets.token_hex(32).encode())
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SessionManager:
+    """Issues and checks tokens, and remembers revoked ones until they expire"""
+
+    def __init__(self, secret: bytes = None, ttl: int = SESSION_TTL, revoked=None):
+        self.secret = secret or load_secret()
+        self.ttl = ttl
+        # jti -> expiry time, shared by every worker (any shared/state store)
+        self.revoked = revoked if revoked is not None else SqliteStateStore("revoked_sessions", SESSION_DB)
+        self.last_purge = 0.0
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, username: str) -> str:
+        claims = {"u": username, "exp": int(time.time()) + self.ttl, "jti": secrets.token_hex(8)}
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{payload}.{self._sign(payload)}"
+
+    def _claims(self, token: str) -> Optional[dict]:
+        """Claims of a correctly signed token, or None"""
+        try:
+            payload, signature = token.split(".")
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            return json.loads(_b64decode(payload))
+        except (ValueError, AttributeError):
+            return None
+
+    def verify(self, token: str) -> Optional[str]:
+        """Username for a valid, unexpired, unrevoked token, else None"""
+        claims = self._claims(token)
+        if claims is None or claims["exp"] < time.time() or self.revoked.get(claims["jti"]) is not None:
+            return None
+        return claims["u"]
+
+    def revoke(self, token: str) -> bool:
+        claims = self._claims(token)
+        if claims is None:
+            return False
+        self.revoked.put(claims["jti"], claims["exp"])
+        self._purge()
+        return True
+
+    def _purge(self):
+        """Expired tokens fail anyway, so stop remembering them (at most once a minute)"""
+        now = time.time()
+        if now - self.last_purge < PURGE_INTERVAL:
+            return
+        self.last_purge = now
+        expired = [(jti, version) for jti, exp, version in self.revoked.items() if exp < now]
+        for jti, version in expired:
+            self.revoked.delete(jti, version)
+
+
+sessions = SessionManager()
@@ -0,0 +1,176 @@
+# gateway/tournaments.py
+# Round-robin and single-elimination tournaments.
+# Every round is started with a fixed number of service calls, however many
+# matches it has: one room /create_many, one game /start_many, and one room
+# /close_many when the round is over. Winners advance as game_over results
+# come in (from players or bots); the last result of a round starts the next.
+import asyncio
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+from gateway.upstream import upstream
+from gateway.connections import connected_players
+
+KINDS = ("round_robin", "single_elimination")
+
+
+def round_robin_rounds(players: List[str]) -> List[List[List[str]]]:
+    """Everyone plays everyone once (circle method); with an odd count one player sits out each round"""
+    entrants: List[Optional[str]] = list(players) + ([None] if len(players) % 2 else [])
+    n = len(entrants)
+    rounds = []
+    for _ in range(n - 1):
+        pairs = [[entrants[i], entrants[n - 1 - i]] for i in range(n // 2)]
+        rounds.append([pair for pair in pairs if None not in pair])
+        entrants = [entrants[0], entrants[-1]] + entrants[1:-1]  # keep the first, rotate the rest
+    return rounds
+
+
+class Tournament:
+    def __init__(self, tournament_id: str, kind: str, players: List[str]):
+        self.id = tournament_id
+        self.kind = kind
+        self.players = players
+        self.status = "running"
+        self.round = 0
+        self.matches: List[dict] = []  # current round: {"room_id", "players", "winner"}
+        self.wins: Dict[str, int] = {p: 0 for p in players}
+        self.champion: Optional[str] = None
+        # Round robin: the whole schedule up front. Elimination: whoever is still in.
+        self.schedule = round_robin_rounds(players) if kind == "round_robin" else None
+        self.alive = list(players)
+        self.bye: Optional[str] = None  # elimination: who goes through this round without playing
+        self.had_bye: set = set()
+
+    def next_pairs(self) -> List[List[str]]:
+        """Pairs for the next round ([] when the tournament is over)"""
+        if self.kind == "round_robin":
+            return self.schedule[self.round] if self.round < len(self.schedule) else []
+        if len(self.alive) < 2:
+            return []
+        playing = list(self.alive)
+        self.bye = None
+        if len(playing) % 2:
+            # Odd one out goes through: someone who has not had a bye yet, if there is anyone
+            self.bye = next((p for p in reversed(playing) if p not in self.had_bye), playing[-1])
+            self.had_bye.add(self.bye)
+            playing.remove(self.bye)
+        return [playing[i:i + 2] for i in range(0, len(playing), 2)]
+
+    def finish_round(self):
+        if self.kind == "single_elimination":
+            self.alive = [m["winner"] for m in self.matches] + ([self.bye] if self.bye else [])
+        self.round += 1
+
+    def standings(self) -> List[dict]:
+        ranked = sorted(self.players, key=lambda p: -self.wins[p])
+        return [{"player": p, "wins": self.wins[p]} for p in ranked]
+
+    def to_dict(self) -> dict:
+        info = {
+            "tournament_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "round": self.round + 1 if self.status == "running" else self.round,
+            "players": len(self.players),
+            "matches": self.matches,
+            "standings": self.standings(),
+            "champion": self.champion,
+        }
+        if self.kind == "round_robin":
+            info["rounds"] = len(self.schedule)
+        else:
+            info["remaining"] = self.alive
+            info["bye"] = self.bye
+        return info
+
+
+class TournamentManager:
+    """Runs tournaments on top of the room/game services.
+
+    on_start(room_id, players) announces a started game to its room (the same
+    as for any other game); bots in a tournament keep playing round to round.
+    """
+
+    def __init__(self, games, bots, on_start):
+        self.games = games
+        self.bots = bots
+        self.on_start = on_start
+        self.tournaments: Dict[str, Tournament] = {}
+        self.rooms: Dict[str, Tuple[Tournament, dict]] = {}  # room_id -> (tournament, match)
+        self.ids = itertools.count()
+
+    async def create(self, kind: str, players: List[str]) -> Tournament:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown tournament kind! Use: {list(KINDS)}")
+        if len(players) < 2 or len(set(players)) != len(players):
+            raise ValueError("Need at least two different players")
+        tournament = Tournament(f"T{next(self.ids)}", kind, players)
+        self.tournaments[tournament.id] = tournament
+        await self._start_round(tournament)
+        return tournament
+
+    async def _start_round(self, tournament: Tournament):
+        pairs = tournament.next_pairs()
+        if not pairs:
+            self._finish(tournament)
+            return
+        try:
+            status, data = await upstream.call("room", "/create_many", {"rooms": pairs})
+            if status != 200:
+                raise RuntimeError(data.get("detail", f"room service returned {status}"))
+            tournament.matches = [
+                {"room_id": room_id, "players": pair, "winner": None}
+                for room_id, pair in zip(data["room_ids"], pairs)
+            ]
+            status, data = await self.games.start_many([(m["room_id"], m["players"]) for m in tournament.matches])
+            if status != 200:
+                raise RuntimeError(data.get("detail", f"game service returned {status}"))
+        except Exception as e:
+            tournament.status = f"failed: {e}"
+            print(f"Tournament {tournament.id} round {tournament.round + 1} failed: {e}")
+            return
+
+        for match in tournament.matches:
+            room_id = match["room_id"]
+            self.rooms[room_id] = (tournament, match)
+            for player in match["players"]:
+                if self.bots.is_bot(player):
+                    self.bots.add_to_room(room_id, player)
+            await self.on_start(room_id, match["players"])
+
+    def on_game_over(self, room_id: str, winner: str) -> bool:
+        """Record a result. False if the room is not part of a tournament."""
+        entry = self.rooms.pop(room_id, None)
+        if entry is None:
+            return False
+        tournament, match = entry
+        match["winner"] = winner
+        tournament.wins[winner] += 1
+        self.bots.leave_room(room_id)
+        if all(m["winner"] is not None for m in tournament.matches):
+            asyncio.create_task(self._next_round(tournament))
+        return True
+
+    async def _next_round(self, tournament: Tournament):
+        room_ids = [m["room_id"] for m in tournament.matches]
+        try:
+            await upstream.call("room", "/close_many", {"room_ids": room_ids})
+        except Exception:
+            pass  # the room service sweeper removes them later anyway
+        tournament.finish_round()
+        await self._start_round(tournament)
+
+    def _finish(self, tournament: Tournament):
+        tournament.status = "finished"
+        if tournament.kind == "single_elimination":
+            tournament.champion = tournament.alive[0]
+        else:
+            tournament.champion = tournament.standings()[0]["player"]
+        for player in tournament.players:
+            if self.bots.is_bot(player):
+                self.bots.remove_bot(player)
+            conn = connected_players.get(player)
+            if conn is not None:
+                conn.send_json({"type": "tournament_over", "tournament_id": tournament.id,
+                                "champion": tournament.champion})
@@ -0,0 +1,124 @@
+# gateway/upstream.py
+# One shared HTTP client for every call the gateway makes to the other services.
+# Each service gets its own keep-alive connection pool, so an auth burst cannot
+# take all the connections the room/game services need.
+import os
+import time
+import aiohttp
+
+from shared.metrics import registry
+
+USER_URL = os.environ.get("USER_URL", "http://localhost:8001")
+ROOM_URL = os.environ.get("ROOM_URL", "http://localhost:8002")
+GAME_URL = os.environ.get("GAME_URL", "http://localhost:8003")
+
+# Pool settings (can be changed with environment variables)
+POOL_LIMIT = int(os.environ.get("UPSTREAM_POOL_LIMIT", "100"))          # max connections per service
+KEEPALIVE_TIMEOUT = float(os.environ.get("UPSTREAM_KEEPALIVE", "30"))   # seconds an idle connection is kept
+REQUEST_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "5"))        # seconds for a whole request
+MAX_IN_FLIGHT = int(os.environ.get("UPSTREAM_MAX_IN_FLIGHT", "400"))     # calls at once, all services together
+
+
+upstream_seconds = registry.histogram(
+    "upstream_request_duration_seconds", "Time for a gateway call to another service", ["service", "path"])
+upstream_errors = registry.counter(
+    "upstream_errors_total", "Gateway calls that failed (connection error or timeout)", ["service", "path"])
+upstream_shed = registry.counter(
+    "upstream_shed_total", "Gateway calls refused because MAX_IN_FLIGHT calls were already running", ["service"])
+
+
+class Overloaded(Exception):
+    """Too many upstream calls are already running; try again later"""
+
+
+class UpstreamClient:
+    """Pooled keep-alive client for the user, room and game services"""
+
+    def __init__(self, services=None, limit=POOL_LIMIT, keepalive_timeout=KEEPALIVE_TIMEOUT,
+                 timeout=REQUEST_TIMEOUT, max_in_flight=MAX_IN_FLIGHT):
+        # Example: {"user": "http://localhost:8001", ...}
+        self.services = services or {"user": USER_URL, "room": ROOM_URL, "game": GAME_URL}
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.sessions = {}  # service name -> aiohttp.ClientSession
+
+    async def start(self):
+        """Create one session (and connection pool) per service"""
+        for name, base_url in self.services.items():
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self.sessions[name] = aiohttp.ClientSession(
+                base_url=base_url,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+    async def close(self):
+        """Close all pools (called on gateway shutdown)"""
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions = {}
+
+    async def call(self, service: str, path: str, payload: dict = None, timeout: float = None):
+        """POST payload to a service and return (status, json body).
+
+        The body is always read, so the connection goes back to the pool.
+        Raises aiohttp.ClientError / asyncio.TimeoutError if the service is down,
+        and Overloaded (without waiting) if max_in_flight calls are already running.
+        """
+        if self.in_flight >= self.max_in_flight:
+            upstream_shed.inc(service)
+            raise Overloaded(f"{self.in_flight} upstream calls in flight")
+        session = self.sessions[service]
+        kwargs = {"json": payload}
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        start = time.perf_counter()
+        self.in_flight += 1
+        try:
+            async with session.post(path, **kwargs) as resp:
+                try:
+                    data = await resp.json(content_type=None)
+                except ValueError:
+                    data = {}
+                return resp.status, data
+        except Exception:
+            upstream_errors.inc(service, path)
+            raise
+        finally:
+            self.in_flight -= 1
+            upstream_seconds.observe(time.perf_counter() - start, service, path)
+
+    def metrics(self) -> dict:
+        """Pool usage per service: open, idle and waiting connections"""
+        stats = {}
+        for name, session in self.sessions.items():
+            connector = session.connector
+            # aiohttp keeps these as private fields, so read them defensively
+            in_use = len(getattr(connector, "_acquired", ()))
+            idle = sum(len(c) for c in getattr(connector, "_conns", {}).values())
+            waiting = sum(len(w) for w in getattr(connector, "_waiters", {}).values())
+            stats[name] = {
+                "open": in_use + idle,
+                "in_use": in_use,
+                "idle": idle,
+                "waiting": waiting,
+                "limit": self.limit,
+            }
+        return stats
+
+
+# The gateway-wide client (sessions are created in the app lifespan)
+upstream = UpstreamClient()
+
+registry.gauge(
+    "upstream_connections", "Gateway connection pool usage per service", ["service", "state"],
+    callback=lambda: {(name, state): pool[state] for name, pool in upstream.metrics().items()
+                      for state in ("in_use", "idle", "waiting")},
+)
+registry.gauge("upstream_in_flight", "Gateway calls to other services running now", callback=lambda: upstream.in_flight)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Start the Prime Challenge services with one command.
+
+    python launch.py                          # all four services in one process
+    python launch.py gateway user+room+game   # two processes: the gateway, and the rest together
+    python launch.py --config launch.json     # processes, host, ports and environment from a file
+
+Each argument is one process; "+" puts several services in the same process.
+They share one event loop (and one copy of FastAPI and pydantic) but each
+keeps its own port, so clients and the gateway's service URLs do not change.
+A service's code is only imported by the process that runs it, and every
+process prints how long each of its services took to import and to start
+(lifespan plus opening its port).
+
+Config file (JSON, every key optional; arguments on the command line win):
+
+    {"processes": ["gateway", "user+room+game"],
+     "host": "0.0.0.0",
+     "ports": {"gateway": 8000, "user": 8001, "room": 8002, "game": 8003},
+     "env": {"GAME_MODE": "remote", "LOG_LEVEL": "WARNING"}}
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+STARTED = time.perf_counter()
+
+# name -> (app, default port). Started in this order: the gateway last.
+SERVICES = {
+    "user": ("user_service.main:app", 8001),
+    "room": ("room_service.main:app", 8002),
+    "game": ("game_service.main:app", 8003),
+    "gateway": ("gateway.main:app", 8000),
+}
+URL_VARIABLES = {"user": "USER_URL", "room": "ROOM_URL", "game": "GAME_URL"}  # read by gateway/upstream.py
+
+
+def parse_group(text: str) -> List[str]:
+    names = [name.strip() for name in text.split("+") if name.strip()]
+    for name in names:
+        if name not in SERVICES:
+            raise SystemExit(f"Unknown service {name!r}! Use: {list(SERVICES)}")
+    return sorted(set(names), key=list(SERVICES).index)
+
+
+def load_config(path: str) -> dict:
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def apply_env(config: dict, host: str, ports: Dict[str, int]):
+    """Environment from the config, and the gateway's service URLs for the ports in use"""
+    for key, value in config.get("env", {}).items():
+        os.environ[key] = str(value)
+    client_host = "localhost" if host in ("0.0.0.0", "::", "") else host
+    for name, variable in URL_VARIABLES.items():
+        os.environ.setdefault(variable, f"http://{client_host}:{ports[name]}")
+
+
+async def serve(names: List[str], host: str, ports: Dict[str, int], log_level: str):
+    """Run several services on this process's event loop until SIGINT/SIGTERM"""
+    import uvicorn  # only processes that serve something need it
+
+    class Server(uvicorn.Server):
+        @contextlib.contextmanager
+        def capture_signals(self):
+            yield  # the launcher stops every server in this process together
+
+    servers = {}
+    for name in names:
+        start = time.perf_counter()
+        module, attr = SERVICES[name][0].split(":")
+        app = getattr(importlib.import_module(module), attr)
+        imported = time.perf_counter()
+        server = Server(uvicorn.Config(app, host=host, port=ports[name], log_level=log_level))
+        task = asyncio.create_task(server.serve())
+        while not server.started and not task.done():
+            await asyncio.sleep(0.001)
+        servers[name] = (server, task)
+        print(f"[launch] {name:<8} import {imported - start:6.3f}s  start {time.perf_counter() - imported:6.3f}s"
+              f"  http://{host}:{ports[name]}")
+    print(f"[launch] {'+'.join(names)} ready in {time.perf_counter() - STARTED:.3f}s (pid {os.getpid()})")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop.set))
+    stopping = asyncio.create_task(stop.wait())
+    await asyncio.wait([stopping] + [task for _, task in servers.values()], return_when=asyncio.FIRST_COMPLETED)
+
+    # The gateway first: it still calls the other services while it shuts down
+    for name in reversed(names):
+        server, task = servers[name]
+        server.should_exit = True
+        await task
+    stopping.cancel()
+
+
+def run_processes(groups: List[List[str]], args) -> int:
+    """One child process per group; stop them all when one stops or we are told to"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    common = ["--host", args.host, "--log-level", args.log_level]
+    if args.config:
+        common += ["--config", os.path.abspath(args.config)]
+    children = [
+        subprocess.Popen([sys.executable, os.path.join(here, "launch.py"), "+".join(group), *common], cwd=here)
+        for group in groups
+    ]
+
+    def terminate(*_):
+        for child in children:
+            if child.poll() is None:
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        while all(child.poll() is None for child in children):
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass  # the children got the Ctrl-C too
+    terminate()
+    return max(abs(child.wait()) for child in children)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start the services in one or more processes")
+    parser.add_argument("processes", nargs="*", metavar="SERVICES",
+                        help=f"one process per argument, services joined with '+' (from {list(SERVICES)}); "
+                             "default: all in one process")
+    parser.add_argument("--config", help="JSON file with processes, host, ports and env")
+    parser.add_argument("--host", default=None, help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--log-level", default="warning", help="uvicorn log level")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    args.host = args.host or config.get("host", "127.0.0.1")
+    ports = {name: int(config.get("ports", {}).get(name, port)) for name, (_, port) in SERVICES.items()}
+    groups = [parse_group(text) for text in (args.processes or config.get("processes") or ["+".join(SERVICES)])]
+    apply_env(config, args.host, ports)
+
+    if len(groups) == 1:
+        asyncio.run(serve(groups[0], args.host, ports, args.log_level))
+    else:
+        sys.exit(run_processes(groups, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Load generator for Prime Challenge Game.
+
+Plays N pairs of simulated players against a running gateway over the same
+WebSocket protocol as cli_client.py (auth, create_room, join_room, move,
+restart_game) and reports move-to-update latency, games per second and errors.
+
+    python load_test.py --pairs 100 --games 20
+    python load_test.py --pairs 500 --json results.json   # also save the numbers
+    python load_test.py --encoding compact                # numeric-code frames (gateway/codec.py)
+
+Players are registered (password "loadtest") and logged in before the clock
+starts; the measured phase is only the games themselves.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from typing import Dict, List
+
+import aiohttp
+import websockets
+
+from gateway.codec import ENCODINGS, decode, encode
+
+GATEWAY_URL = "http://localhost:8000"
+WS_URL = "ws://localhost:8000/ws"
+PRIMES = [2, 3, 5, 7, 11]
+TARGET = 31
+PASSWORD = "loadtest"
+
+
+class Stats:
+    """Numbers collected by every pair"""
+
+    def __init__(self):
+        self.latencies: List[float] = []  # seconds from sending a move to the opponent seeing the update
+        self.games = 0
+        self.moves = 0
+        self.operations = 0
+        self.ready = 0  # pairs done with setup (connected or failed)
+        self.errors: Counter = Counter()
+
+    def error(self, kind: str):
+        self.errors[kind] += 1
+
+
+class Player:
+    """One WebSocket connection; messages are queued by a receiver task"""
+
+    def __init__(self, name: str, encoding: str = "json"):
+        self.name = name
+        self.encoding = encoding
+        self.ws = None
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = None
+
+    async def connect(self, ws_url: str, token: str):
+        self.ws = await websockets.connect(ws_url)
+        self.task = asyncio.create_task(self._receive())
+        await self.ws.send(json.dumps({"type": "auth", "token": token, "encoding": self.encoding}))
+        await self.expect("logged_in")
+
+    async def _receive(self):
+        try:
+            async for raw in self.ws:
+                self.queue.put_nowait((time.perf_counter(), decode(raw)))
+        except websockets.ConnectionClosed:
+            pass
+        self.queue.put_nowait((time.perf_counter(), {"type": "error", "message": "Connection closed"}))
+
+    async def send(self, msg: dict):
+        await self.ws.send(encode(msg, self.encoding))
+
+    async def expect(self, *types: str):
+        """Next message of one of these types as (arrival time, message); an error message raises"""
+        while True:
+            arrived, msg = await self.queue.get()
+            if msg["type"] == "error":
+                raise RuntimeError(msg.get("message", "Unknown error"))
+            if msg["type"] in types:
+                return arrived, msg
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self.task is not None:
+            await self.task
+
+
+async def get_token(session: aiohttp.ClientSession, url: str, username: str) -> str:
+    """Register (if needed) and log in, returns the session token"""
+    async with session.post(f"{url}/register", json={"username": username, "password": PASSWORD}):
+        pass  # 400 means the user exists from an earlier run
+    async with session.post(f"{url}/login", json={"username": username, "password": PASSWORD}) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"Login failed for {username}: {resp.status}")
+        return (await resp.json())["token"]
+
+
+async def play_pair(index: int, args, session: aiohttp.ClientSession, go: asyncio.Event, stats: Stats):
+    first = Player(f"{args.prefix}{index}a", args.encoding)
+    second = Player(f"{args.prefix}{index}b", args.encoding)
+    players = {first.name: first, second.name: second}
+    step = "setup"
+    try:
+        try:
+            for player in (first, second):
+                stats.operations += 1
+                await player.connect(args.ws_url, await get_token(session, args.url, player.name))
+        finally:
+            stats.ready += 1
+
+        await go.wait()
+        step = "create_room"
+        stats.operations += 1
+        await first.send({"type": "create_room"})
+        _, msg = await asyncio.wait_for(first.expect("room_created"), args.timeout)
+
+        step = "join_room"
+        stats.operations += 1
+        await second.send({"type": "join_room", "room_id": msg["room_id"]})
+        _, update = await asyncio.wait_for(first.expect("update"), args.timeout)
+        await asyncio.wait_for(second.expect("update"), args.timeout)
+
+        for game in range(args.games):
+            while True:
+                mover = players[update["turn"]]
+                opponent = second if mover is first else first
+                prime = random.choice([p for p in PRIMES if update["sum"] + p <= TARGET])
+
+                step = "move"
+                stats.operations += 1
+                sent = time.perf_counter()
+                await mover.send({"type": "move", "prime": prime})
+                arrived, update = await asyncio.wait_for(opponent.expect("update", "game_over"), args.timeout)
+                await asyncio.wait_for(mover.expect("update", "game_over"), args.timeout)
+                stats.latencies.append(arrived - sent)
+                stats.moves += 1
+                if update["type"] == "game_over":
+                    break
+            stats.games += 1
+
+            if game + 1 < args.games:
+                step = "restart_game"
+                stats.operations += 1
+                await first.send({"type": "restart_game"})
+                _, update = await asyncio.wait_for(first.expect("update"), args.timeout)
+                await asyncio.wait_for(second.expect("update"), args.timeout)
+    except asyncio.TimeoutError:
+        stats.error(f"{step}: timeout")
+    except Exception as e:
+        stats.error(f"{step}: {e}")
+    finally:
+        for player in (first, second):
+            try:
+                await player.close()
+            except Exception:
+                pass
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def report(args, stats: Stats, duration: float) -> Dict:
+    latencies = sorted(stats.latencies)
+    errors = sum(stats.errors.values())
+    return {
+        "pairs": args.pairs,
+        "games_per_pair": args.games,
+        "encoding": args.encoding,
+        "duration_s": round(duration, 3),
+        "games": stats.games,
+        "moves": stats.moves,
+        "games_per_s": round(stats.games / duration, 1) if duration else 0.0,
+        "moves_per_s": round(stats.moves / duration, 1) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "operations": stats.operations,
+        "errors": errors,
+        "error_rate": round(errors / stats.operations, 4) if stats.operations else 0.0,
+        "error_kinds": dict(stats.errors.most_common()),
+    }
+
+
+def print_summary(result: Dict):
+    latency = result["latency_ms"]
+    print(f"{result['pairs']} pairs x {result['games_per_pair']} games in {result['duration_s']}s")
+    print(f"  games: {result['games']} ({result['games_per_s']}/s)")
+    print(f"  moves: {result['moves']} ({result['moves_per_s']}/s)")
+    print(f"  move-to-update latency: p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+          f"p99 {latency['p99']} ms, max {latency['max']} ms")
+    print(f"  errors: {result['errors']} of {result['operations']} operations ({result['error_rate']:.2%})")
+    for kind, count in result["error_kinds"].items():
+        print(f"    {count:>6}  {kind}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load test the gateway with simulated player pairs")
+    parser.add_argument("--pairs", type=int, default=50, help="concurrent player pairs")
+    parser.add_argument("--games", type=int, default=10, help="games each pair plays")
+    parser.add_argument("--url", default=GATEWAY_URL)
+    parser.add_argument("--ws-url", default=WS_URL)
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for any reply")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="json", help="WebSocket message encoding")
+    parser.add_argument("--prefix", default="load", help="username prefix for the simulated players")
+    parser.add_argument("--json", metavar="FILE", help="also write the results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    stats = Stats()
+    go = asyncio.Event()
+    connector = aiohttp.TCPConnector(limit=50)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        print(f"Logging in {2 * args.pairs} players...")
+        tasks = [asyncio.create_task(play_pair(i, args, session, go, stats)) for i in range(args.pairs)]
+        # Wait until every pair is connected (or failed) before starting the clock
+        while stats.ready < args.pairs:
+            await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        go.set()
+        await asyncio.gather(*tasks)
+        duration = time.perf_counter() - start
+
+    result = report(args, stats, duration)
+    print_summary(result)
+    if args.json == "-":
+        print(json.dumps(result, indent=2))
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
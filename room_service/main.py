@@ -1,13 +1,48 @@
 # room_service/main.py
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Dict
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional
+import asyncio
+import json
+import os
+import time
 
-app = FastAPI(title="Room Service")
+from shared.state import StateBusy, make_store
+from shared.metrics import instrument, registry
 
-# Stores all rooms: "R0": {"players": ["alice"], "status": "waiting"}
-rooms: Dict[str, dict] = {}
-counter = 0
+ROOM_TTL = float(os.environ.get("ROOM_TTL", "3600"))             # seconds a room may sit idle
+SWEEP_INTERVAL = float(os.environ.get("ROOM_SWEEP_INTERVAL", "30"))
+CAS_RETRIES = 10  # attempts when another worker keeps changing the same room
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweeper = asyncio.create_task(sweep_rooms())
+    yield
+    sweeper.cancel()
+    rooms.close()
+    waiting_rooms.close()
+
+app = FastAPI(title="Room Service", lifespan=lifespan)
+instrument(app, "room")
+
+@app.exception_handler(StateBusy)
+async def state_busy(request, e: StateBusy):
+    """The shared database stayed locked (STATE_STORE=sqlite): retry, like a lost compare-and-set"""
+    return JSONResponse(status_code=409, content={"detail": "Room is busy, try again"})
+
+# Stores all rooms: "R0": {"players": ["alice"], "status": "waiting", "bucket": None, "last_active": ...}
+# Ordered by last activity (oldest first), so the sweeper only looks at expired rooms.
+# With STATE_STORE=sqlite every worker (--workers N) shares the same rooms and room IDs.
+rooms = make_store("rooms", ordered=True)
+
+# Quick-match rooms waiting for a second player, oldest first: json.dumps(bucket) -> {room_id: username}
+waiting_rooms = make_store("waiting_rooms")
+
+registry.gauge("rooms", "Rooms in the rooms table", callback=lambda: len(rooms))
+registry.gauge("waiting_rooms", "Quick-match rooms waiting for a second player",
+               callback=lambda: sum(len(queue) for _, queue, _ in waiting_rooms.items()))
 
 class CreateRequest(BaseModel):
     username: str
@@ -16,26 +51,180 @@ class JoinRequest(BaseModel):
     room_id: str
     username: str
 
+class CloseRequest(BaseModel):
+    room_id: str
+
+class CreateManyRequest(BaseModel):
+    rooms: List[List[str]]  # the players of each room
+
+class CloseManyRequest(BaseModel):
+    room_ids: List[str]
+
+class QuickMatchEntry(BaseModel):
+    username: str
+    bucket: Optional[str] = None  # e.g. skill level or region; players only meet their own bucket
+
+class QuickMatchRequest(BaseModel):
+    players: List[QuickMatchEntry]
+
+def new_room(players: List[str], bucket: Optional[str] = None) -> str:
+    room_id = f"R{rooms.next_id('room')}"
+    status = "full" if len(players) >= 2 else "waiting"
+    rooms.put(room_id, {"players": players, "status": status, "bucket": bucket, "last_active": time.time()})
+    return room_id
+
+def update_room(room_id: str, change: Callable[[dict], None]) -> dict:
+    """Read a room, apply change() and write it back, retrying if another worker changed it"""
+    for _ in range(CAS_RETRIES):
+        found = rooms.get(room_id)
+        if found is None:
+            raise HTTPException(404, "Room not found!")
+        room, version = found
+        change(room)
+        room["last_active"] = time.time()
+        if rooms.cas(room_id, room, version):
+            return room
+    raise HTTPException(409, "Room is busy, try again")
+
+def add_player(username: str) -> Callable[[dict], None]:
+    def change(room: dict):
+        if len(room["players"]) >= 2:
+            raise HTTPException(400, "Room is full!")
+        if username in room["players"]:
+            raise HTTPException(400, "You are already in this room!")
+        room["players"].append(username)
+        room["status"] = "full"
+    return change
+
+def update_queue(bucket: Optional[str], change: Callable[[dict], None]):
+    """Apply change() to a bucket's waiting rooms, dropping the bucket once it is empty"""
+    key = json.dumps(bucket)
+    for _ in range(CAS_RETRIES):
+        found = waiting_rooms.get(key)
+        queue, version = found if found is not None else ({}, None)
+        change(queue)
+        if found is None:
+            done = not queue or waiting_rooms.add(key, queue)
+        elif not queue:
+            done = waiting_rooms.delete(key, version)
+        else:
+            done = waiting_rooms.cas(key, queue, version)
+        if done:
+            return
+    raise HTTPException(409, "Matchmaking is busy, try again")
+
+def unqueue(room_id: str, bucket: Optional[str]):
+    """Take a room out of the quick-match index (no-op for private rooms)"""
+    found = waiting_rooms.get(json.dumps(bucket))
+    if found is not None and room_id in found[0]:
+        update_queue(bucket, lambda queue: queue.pop(room_id, None))
+
+def remove_room(room_id: str):
+    found = rooms.get(room_id)
+    if found is not None and rooms.delete(room_id, found[1]):
+        unqueue(room_id, found[0]["bucket"])
+
 # Player creates a new room
 @app.post("/create")
 async def create_room(req: CreateRequest):
-    global counter
-    room_id = f"R{counter}"
-    counter += 1
-    rooms[room_id] = {"players": [req.username], "status": "waiting"}
-    return {"room_id": room_id}
+    return {"room_id": new_room([req.username])}
+
+# Rooms for a whole tournament round in one call
+@app.post("/create_many")
+async def create_many(req: CreateManyRequest):
+    return {"room_ids": [new_room(players) for players in req.rooms]}
 
 # Second player joins the room
 @app.post("/join")
 async def join_room(req: JoinRequest):
-    if req.room_id not in rooms:
-        raise HTTPException(404, "Room not found!")
-    room = rooms[req.room_id]
-    if len(room["players"]) >= 2:
-        raise HTTPException(400, "Room is full!")
-    if req.username in room["players"]:
-        raise HTTPException(400, "You are already in this room!")
-    
-    room["players"].append(req.username)
-    room["status"] = "full"
-    return {"players": room["players"]}
\ No newline at end of file
+    room = update_room(req.room_id, add_player(req.username))
+    unqueue(req.room_id, room["bucket"])
+    return {"players": room["players"]}
+
+def quick_match(username: str, bucket: Optional[str]) -> dict:
+    """Join the oldest waiting room in the bucket, or open a new one.
+
+    A player who is already waiting in the bucket (a retried request) gets
+    their own room back instead of a second one.
+    """
+    found = waiting_rooms.get(json.dumps(bucket))
+    queue = found[0] if found is not None else {}
+    for room_id, waiting in list(queue.items()):
+        if waiting == username:
+            room = rooms.get(room_id)
+            if room is not None and room[0]["players"] == [username]:
+                return {"username": username, "room_id": room_id, "matched": False, "players": [username]}
+            unqueue(room_id, bucket)  # closed or filled in the meantime
+    for room_id in list(queue):
+        try:
+            room = update_room(room_id, add_player(username))
+        except HTTPException as e:
+            if e.detail == "You are already in this room!":
+                continue
+            # Closed or filled by another worker in the meantime
+            unqueue(room_id, bucket)
+            continue
+        try:
+            unqueue(room_id, bucket)
+        except (StateBusy, HTTPException):
+            pass  # the player is in; a full room left in the queue is dropped by the next quick_match
+        return {"username": username, "room_id": room_id, "matched": True, "players": room["players"]}
+    room_id = new_room([username], bucket)
+    update_queue(bucket, lambda queue: queue.setdefault(room_id, username))
+    return {"username": username, "room_id": room_id, "matched": False, "players": [username]}
+
+# Pair players who want any opponent (first come, first served)
+@app.post("/quickmatch")
+async def quickmatch(req: QuickMatchRequest):
+    """Takes a batch of players; each either fills a waiting room or gets a new one to wait in.
+
+    A player who cannot be placed (database busy, queue contended) gets
+    {"username", "error"}; the rest of the batch still goes through.
+    """
+    results = []
+    for entry in req.players:
+        try:
+            results.append(quick_match(entry.username, entry.bucket))
+        except HTTPException as e:
+            results.append({"username": entry.username, "error": e.detail})
+        except StateBusy:
+            results.append({"username": entry.username, "error": "Matchmaking is busy, try again"})
+    return {"results": results}
+
+# Room is finished or everyone left
+@app.post("/close")
+async def close_room(req: CloseRequest):
+    remove_room(req.room_id)
+    return {"message": "closed"}
+
+@app.post("/close_many")
+async def close_many(req: CloseManyRequest):
+    for room_id in req.room_ids:
+        remove_room(room_id)
+    return {"message": "closed", "count": len(req.room_ids)}
+
+@app.get("/stats")
+async def room_stats():
+    queues = [queue for _, queue, _ in waiting_rooms.items()]
+    return {
+        "rooms": len(rooms),
+        "waiting": sum(len(queue) for queue in queues),
+        "buckets": len(queues),
+    }
+
+async def sweep_rooms():
+    """Remove rooms nobody has touched for ROOM_TTL seconds"""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        deadline = time.time() - ROOM_TTL
+        expired = []
+        try:
+            for room_id, room, version in rooms.items():
+                if room["last_active"] > deadline:
+                    break
+                expired.append((room_id, room, version))
+            for room_id, room, version in expired:
+                if rooms.delete(room_id, version):
+                    unqueue(room_id, room["bucket"])
+        except (StateBusy, HTTPException):
+            pass  # the database is locked right now; the rest go next time
@@ -0,0 +1,98 @@
+# shared/logs.py
+# Structured (one JSON object per line) logging that never blocks a request.
+# Records go into a bounded queue and a background thread writes them to
+# stdout; if the queue is full the record is dropped and counted instead.
+#
+#     from shared.logs import get_logger
+#     log = get_logger("game")
+#     log.event("game_started", room_id=room_id, players=players)
+#     log.sampled("move", room_id=room_id, prime=prime)   # 1 in LOG_SAMPLE_RATE^-1
+#
+#   LOG_LEVEL        - INFO (default), WARNING to silence events
+#   LOG_SAMPLE_RATE  - fraction of hot-path events (moves) that are logged, default 0.01
+#   LOG_QUEUE_SIZE   - records waiting to be written before new ones are dropped
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                 "event": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking (or erroring) when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record  # formatting happens on the writer thread
+
+
+class EventLogger(logging.LoggerAdapter):
+    """Logger with keyword fields: log.event("name", key=value, ...)"""
+
+    def __init__(self, logger: logging.Logger, sample_rate: float = LOG_SAMPLE_RATE):
+        super().__init__(logger, {})
+        self.sample_rate = sample_rate
+
+    def event(self, name: str, level: int = logging.INFO, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, name, extra={"fields": fields})
+
+    def sampled(self, name: str, **fields):
+        """Log only a sample of a frequent event; the sample rate is included in the record"""
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            self.event(name, sample_rate=self.sample_rate, **fields)
+
+
+_handler: DroppingQueueHandler = None
+_listener: logging.handlers.QueueListener = None
+
+
+def _setup():
+    global _handler, _listener
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = DroppingQueueHandler(log_queue)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(_listener.stop)  # write what is still queued
+
+
+def get_logger(name: str) -> EventLogger:
+    if _handler is None:
+        _setup()
+    logger = logging.getLogger(f"prime.{name}")
+    if _handler not in logger.handlers:
+        logger.addHandler(_handler)
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+    return EventLogger(logger)
+
+
+def dropped() -> int:
+    """Records dropped because the queue was full"""
+    return _handler.dropped if _handler is not None else 0
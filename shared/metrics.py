@@ -0,0 +1,191 @@
+# shared/metrics.py
+# Prometheus-style metrics for every service, served as text at GET /metrics.
+#
+#     from shared.metrics import instrument, registry
+#     instrument(app, "game")                           # route latency + /metrics
+#     moves = registry.counter("game_moves_total", "Moves applied", ["result"])
+#     moves.inc("ok")
+#     registry.gauge("games", "Live games", callback=lambda: len(engine.games))
+#
+# Everything is plain in-process counters (no dependency on prometheus_client);
+# with --workers N each worker reports its own numbers. Services started in one
+# process (launch.py) share the registry, so the HTTP metrics carry a "service" label.
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from shared import logs
+
+# Seconds; fine enough for in-process calls, wide enough for slow upstreams
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    """Value that only goes up, one per combination of label values"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """Value that goes up and down. With a callback it is read at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), callback: Optional[Callable] = None):
+        super().__init__(name, help, labels)
+        self.callback = callback  # () -> number, or () -> {label tuple: number} when labelled
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            value = self.callback()
+            self.values = value if isinstance(value, dict) else {(): value}
+        return super().samples()
+
+
+class Histogram:
+    """Observations counted into fixed buckets, plus their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (last one is +Inf), sum]
+        self.values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        names = self.labels + ("le",)
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """All metrics of one process"""
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            return self.metrics[metric.name]  # importing a module twice must not fail
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), callback: Optional[Callable] = None) -> Gauge:
+        return self._add(Gauge(name, help, labels, callback))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request", ["service", "method", "route"])
+responses = registry.counter("http_responses_total", "HTTP responses sent", ["service", "method", "route", "status"])
+
+
+class MetricsMiddleware:
+    """Times every HTTP request by route template ("/state/{room_id}", not the raw path)"""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            request_seconds.observe(time.perf_counter() - start, self.service, scope["method"], path)
+            responses.inc(self.service, scope["method"], path, status)
+
+
+def instrument(app: FastAPI, service: str):
+    """Add request timing (labelled with the service name) and a GET /metrics endpoint to a service"""
+    app.add_middleware(MetricsMiddleware, service=service)
+    registry.gauge("log_records_dropped", "Log records dropped because the log queue was full",
+                   callback=logs.dropped)
+
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
@@ -0,0 +1,209 @@
+# shared/state.py
+# Key-value state stores used by room_service and game_service.
+#   STATE_STORE=memory (default) - a dict in this process (one uvicorn worker)
+#   STATE_STORE=sqlite           - a SQLite file in WAL mode at STATE_DB, shared
+#                                  by every worker on the machine (--workers N)
+#
+# Writes that depend on what was read use compare-and-set: get() returns a
+# version, cas() only writes if nobody changed the key since. Callers retry on
+# a failed cas(), so two workers can never both apply a move to the same game.
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+STATE_STORE = os.environ.get("STATE_STORE", "memory")
+STATE_DB = os.environ.get("STATE_DB", "/tmp/prime-challenge-state.db")
+STATE_BUSY_TIMEOUT = float(os.environ.get("STATE_BUSY_TIMEOUT", "0.1"))  # seconds to wait for a locked database
+
+
+class MemoryStateStore:
+    """In-process store.
+
+    Values are kept as the objects themselves (no copies), and the "version"
+    of a key is the stored object, so cas() fails if the key was deleted or
+    replaced in between. With ordered=True the keys are kept in order of last
+    write, and items() starts with the oldest.
+    """
+
+    def __init__(self, name: str, ordered: bool = False):
+        self.name = name
+        self.data = OrderedDict() if ordered else {}
+        self.ordered = ordered
+        self.counters = {}
+
+    def get(self, key: str) -> Optional[Tuple[Any, Any]]:
+        value = self.data.get(key)
+        return None if value is None else (value, value)
+
+    def add(self, key: str, value) -> bool:
+        """Insert a new key; False if it already exists"""
+        if key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    def put(self, key: str, value):
+        self.data[key] = value
+        if self.ordered:
+            self.data.move_to_end(key)
+
+    def cas(self, key: str, value, version) -> bool:
+        if version is None or self.data.get(key) is not version:
+            return False
+        self.put(key, value)
+        return True
+
+    def delete(self, key: str, version=None) -> bool:
+        """Delete a key (only if unchanged, when a version is given)"""
+        if key not in self.data or (version is not None and self.data[key] is not version):
+            return False
+        del self.data[key]
+        return True
+
+    def items(self) -> Iterator[Tuple[str, Any, Any]]:
+        """(key, value, version), oldest write first for ordered stores.
+
+        Lazy: finish (or stop) iterating before deleting keys.
+        """
+        for key, value in self.data.items():
+            yield key, value, value
+
+    def next_id(self, counter: str) -> int:
+        """0, 1, 2, ... (unique within this store)"""
+        value = self.counters.get(counter, 0)
+        self.counters[counter] = value + 1
+        return value
+
+    def __len__(self):
+        return len(self.data)
+
+    def close(self):
+        pass
+
+
+class StateBusy(Exception):
+    """The SQLite database stayed locked by another worker for STATE_BUSY_TIMEOUT"""
+
+
+class SqliteStateStore:
+    """Store in a SQLite table, shared between processes.
+
+    WAL mode lets readers run while one writer commits; every statement is its
+    own transaction. Values are saved with encode() and read back with decode().
+
+    Statements run on the caller's thread (the event loop), so a write waits at
+    most STATE_BUSY_TIMEOUT for another worker's lock and then raises StateBusy
+    (the services answer 409, like a lost compare-and-set). The connection may
+    be used from any thread; a lock keeps one statement at a time on it.
+    """
+
+    ITEMS_BATCH = 500  # rows read per lock in items()
+
+    def __init__(self, name: str, path: str = STATE_DB, encode: Callable = json.dumps, decode: Callable = json.loads):
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+        self.lock = threading.Lock()
+        # Setup may wait longer: every worker creates the tables at startup
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL, updated REAL NOT NULL)"
+        )
+        self.db.execute(f"CREATE INDEX IF NOT EXISTS {name}_updated ON {name} (updated)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.db.execute(f"PRAGMA busy_timeout = {int(STATE_BUSY_TIMEOUT * 1000)}")
+
+    def _run(self, sql: str, params: tuple = ()) -> Tuple[list, int]:
+        """(rows, rowcount) of one statement; StateBusy if the database stays locked"""
+        with self.lock:
+            try:
+                cursor = self.db.execute(sql, params)
+                # read to the end so the statement (and its write lock) finishes
+                return cursor.fetchall(), cursor.rowcount
+            except sqlite3.OperationalError as e:
+                if "locked" in str(e) or "busy" in str(e):
+                    raise StateBusy(f"{self.name}: {e}") from e
+                raise
+
+    def get(self, key: str) -> Optional[Tuple[Any, int]]:
+        rows, _ = self._run(f"SELECT value, version FROM {self.name} WHERE key = ?", (key,))
+        return (self.decode(rows[0][0]), rows[0][1]) if rows else None
+
+    def add(self, key: str, value) -> bool:
+        _, count = self._run(
+            f"INSERT OR IGNORE INTO {self.name} (key, value, version, updated) VALUES (?, ?, 0, ?)",
+            (key, self.encode(value), time.time()),
+        )
+        return count == 1
+
+    def put(self, key: str, value):
+        self._run(
+            f"INSERT INTO {self.name} (key, value, version, updated) VALUES (?, ?, 0, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, version = version + 1, updated = excluded.updated",
+            (key, self.encode(value), time.time()),
+        )
+
+    def cas(self, key: str, value, version: int) -> bool:
+        _, count = self._run(
+            f"UPDATE {self.name} SET value = ?, version = version + 1, updated = ? WHERE key = ? AND version = ?",
+            (self.encode(value), time.time(), key, version),
+        )
+        return count == 1
+
+    def delete(self, key: str, version: int = None) -> bool:
+        if version is None:
+            _, count = self._run(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+        else:
+            _, count = self._run(f"DELETE FROM {self.name} WHERE key = ? AND version = ?", (key, version))
+        return count == 1
+
+    def items(self) -> Iterator[Tuple[str, Any, int]]:
+        """(key, value, version), oldest write first.
+
+        Reads ITEMS_BATCH rows at a time, so stopping early reads little.
+        """
+        after = (float("-inf"), "")
+        while True:
+            rows, _ = self._run(
+                f"SELECT key, value, version, updated FROM {self.name} WHERE (updated, key) > (?, ?) "
+                f"ORDER BY updated, key LIMIT {self.ITEMS_BATCH}",
+                (after[0], after[1]),
+            )
+            for key, value, version, updated in rows:
+                yield key, self.decode(value), version
+            if len(rows) < self.ITEMS_BATCH:
+                return
+            after = (rows[-1][3], rows[-1][0])
+
+    def next_id(self, counter: str) -> int:
+        """0, 1, 2, ... unique across every process using the database"""
+        rows, _ = self._run(
+            "INSERT INTO counters (name, value) VALUES (?, 0) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1 RETURNING value",
+            (f"{self.name}.{counter}",),
+        )
+        return rows[0][0]
+
+    def __len__(self):
+        return self._run(f"SELECT COUNT(*) FROM {self.name}")[0][0][0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def make_store(name: str, kind: str = STATE_STORE, ordered: bool = False,
+               encode: Callable = json.dumps, decode: Callable = json.loads):
+    """Store for one kind of record ("rooms", "games", ...) using STATE_STORE"""
+    if kind == "sqlite":
+        return SqliteStateStore(name, STATE_DB, encode, decode)
+    if kind == "memory":
+        return MemoryStateStore(name, ordered)
+    raise ValueError(f"Unknown state store: {kind}")
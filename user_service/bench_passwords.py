@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Password hashing benchmark: logins per second for different pool sizes.
+
+    python -m user_service.bench_passwords
+    python -m user_service.bench_passwords --logins 200 --pool-sizes 1 2 4 8 --pool process
+"""
+import argparse
+import asyncio
+import time
+
+from user_service.passwords import PasswordHasher, hash_password
+
+
+async def run(pool_size: int, pool_kind: str, logins: int, stored: str) -> float:
+    # No cache, so every login really hashes
+    hasher = PasswordHasher(pool_size=pool_size, pool_kind=pool_kind, max_waiting=logins, cache_size=0)
+    try:
+        await hasher.verify("warmup", "secret", stored)  # start the workers
+        start = time.perf_counter()
+        results = await asyncio.gather(*(hasher.verify(f"user{i}", "secret", stored) for i in range(logins)))
+        elapsed = time.perf_counter() - start
+    finally:
+        hasher.close()
+    assert all(results)
+    return logins / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark password verification throughput")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread")
+    parser.add_argument("--scheme", choices=["scrypt", "pbkdf2"], default="scrypt")
+    args = parser.parse_args()
+
+    stored = hash_password("secret", args.scheme)
+    print(f"{args.scheme}, {args.pool} pool, {args.logins} logins per run")
+    for size in args.pool_sizes:
+        rate = await run(size, args.pool, args.logins, stored)
+        print(f"pool size {size:>3}: {rate:8.1f} logins/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,65 +1,127 @@
 # user_service/main.py
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+import asyncio
 import os
 
-app = FastAPI(title="User Service")
+from user_service.storage import make_store
+from user_service.passwords import PasswordHasher, HasherBusy, is_hashed
+from shared.metrics import instrument, registry
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    hasher.close()
+    if store is not None:
+        store.close()  # flush and fsync whatever is still buffered
+
+app = FastAPI(title="User Service", lifespan=lifespan)
+instrument(app, "user")
 
 # Note: No CORS needed - this service is only called by the gateway (server-to-server)
 
-# File to store users - saved in the user_service directory
+# Where users are saved: "log" (users.txt, append-only) or "sqlite" (users.db)
+# Both files live in the user_service directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-USERS_FILE = os.path.join(BASE_DIR, "users.txt")
+USER_STORE = os.environ.get("USER_STORE", "log")
+store = None  # opened by the first request that needs it (get_store), not at import
 
-# This dictionary stores usernames and passwords
-# Example: {"alice": "123", "bob": "secret"}
+# Passwords are stored as salted hashes, computed in a bounded worker pool
+hasher = PasswordHasher()
+registry.gauge("password_hash_waiting", "Logins/registrations waiting for a hashing worker",
+               callback=lambda: hasher.waiting)
+
+# This dictionary stores usernames and password hashes
+# Example: {"alice": "scrypt$16384,8,1$<salt>$<hash>"}
+# It is an index in front of the store: the log store fills it when it is
+# opened, the SQLite store fills it as users log in.
 users_db = {}
+registry.gauge("users_indexed", "Users in the in-memory index", callback=lambda: len(users_db))
 
 def load_users():
-    """Load users from the text file"""
-    global users_db
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, "r") as f:
-                for line in f:
-                    line = line.strip()
-                    if line and ":" in line:
-                        username, password = line.split(":", 1)
-                        users_db[username] = password
-        except Exception as e:
-            print(f"Error loading users: {e}")
-
-def save_users():
-    """Save users to the text file"""
+    """Load users from the store"""
     try:
-        with open(USERS_FILE, "w") as f:
-            for username, password in users_db.items():
-                f.write(f"{username}:{password}\n")
+        users_db.update(store.load())
     except Exception as e:
-        print(f"Error saving users: {e}")
+        print(f"Error loading users: {e}")
+
+def get_store():
+    """Open the store and load the users the first time they are needed.
 
-# Load users on startup
-load_users()
+    Keeps startup (and importing this module) cheap, e.g. for tests and for a
+    new instance that has to answer health checks quickly.
+    """
+    global store
+    if store is None:
+        store = make_store(USER_STORE, BASE_DIR)
+        load_users()
+    return store
+
+def get_password(username: str):
+    """Stored password hash for a user, or None if they do not exist"""
+    user_store = get_store()  # the first call fills users_db
+    if username in users_db:
+        return users_db[username]
+    password = user_store.get(username)
+    if password is not None:
+        users_db[username] = password
+    return password
 
 # This defines the format of data we receive (username + password)
 class UserData(BaseModel):
     username: str
     password: str
 
+def valid_username(username: str) -> bool:
+    """users.txt stores one "username:hash" line per user, so no ":" or line breaks"""
+    return ":" not in username and username.splitlines() in ([], [username])
+
 # Register a new user
 @app.post("/register")
 async def register(user: UserData):
-    if user.username in users_db:
+    if not valid_username(user.username):
+        raise HTTPException(400, "Username cannot contain ':' or line breaks!")
+    if get_password(user.username) is not None:
         raise HTTPException(400, "Username already taken!")
-    users_db[user.username] = user.password
-    save_users()  # Save to file
+    users_db[user.username] = ""  # claim the name before waiting on the hash and disk
+    try:
+        hashed = await hasher.hash(user.password)
+    except HasherBusy:
+        del users_db[user.username]
+        raise HTTPException(503, "Server busy, try again")
+    users_db[user.username] = hashed
+    try:
+        # Disk write (and fsync) runs in a worker thread so the event loop keeps serving
+        await asyncio.to_thread(get_store().add, user.username, hashed)
+    except Exception as e:
+        del users_db[user.username]
+        print(f"Error saving user: {e}")
+        raise HTTPException(500, "Could not save user")
     return {"message": "You are registered!"}
 
 # Login with username + password
 @app.post("/login")
 async def login(user: UserData):
-    if user.username not in users_db:
+    stored = get_password(user.username)
+    if not stored:
         raise HTTPException(401, "Wrong username or password")
-    if users_db[user.username] != user.password:
+    try:
+        ok = await hasher.verify(user.username, user.password, stored)
+    except HasherBusy:
+        raise HTTPException(503, "Server busy, try again")
+    if not ok:
         raise HTTPException(401, "Wrong username or password")
-    return {"message": "Login successful!"}
\ No newline at end of file
+    if not is_hashed(stored):
+        await upgrade_password(user.username, user.password)
+    return {"message": "Login successful!"}
+
+async def upgrade_password(username: str, password: str):
+    """Replace an old plain-text password with a hash after a good login"""
+    try:
+        hashed = await hasher.hash(password)
+        await asyncio.to_thread(get_store().add, username, hashed)
+    except Exception as e:
+        print(f"Error upgrading password for {username}: {e}")
+        return
+    users_db[username] = hashed
\ No newline at end of file
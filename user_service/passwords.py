@@ -0,0 +1,127 @@
+# user_service/passwords.py
+# Salted password hashing that runs off the event loop.
+# Hashes are slow on purpose, so they run in a bounded worker pool; when too many
+# logins are waiting the service answers "busy" instead of queueing forever.
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+HASH_SCHEME = os.environ.get("PASSWORD_HASH", "scrypt")       # "scrypt" or "pbkdf2"
+POOL_KIND = os.environ.get("PASSWORD_POOL", "thread")         # "thread" or "process"
+POOL_SIZE = int(os.environ.get("PASSWORD_POOL_SIZE", str(os.cpu_count() or 2)))
+MAX_WAITING = int(os.environ.get("PASSWORD_MAX_WAITING", "256"))  # queued hashes before we say busy
+CACHE_SIZE = int(os.environ.get("PASSWORD_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.environ.get("PASSWORD_CACHE_TTL", "300"))    # seconds
+
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+PBKDF2_ITERATIONS = 200_000
+
+
+class HasherBusy(Exception):
+    """Too many hashes are already waiting"""
+
+
+def hash_password(password: str, scheme: str = HASH_SCHEME) -> str:
+    """Return "scheme$params$salt$hash" for a new random salt"""
+    salt = os.urandom(16)
+    if scheme == "scrypt":
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+        return f"scrypt${SCRYPT_N},{SCRYPT_R},{SCRYPT_P}${salt.hex()}${digest.hex()}"
+    if scheme == "pbkdf2":
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2${PBKDF2_ITERATIONS}${salt.hex()}${digest.hex()}"
+    raise ValueError(f"Unknown hash scheme: {scheme}")
+
+
+def is_hashed(stored: str) -> bool:
+    """Old users.txt entries hold the plain password"""
+    return stored.startswith(("scrypt$", "pbkdf2$"))
+
+
+def check_password(password: str, stored: str) -> bool:
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        scheme, params, salt, expected = stored.split("$")
+        salt = bytes.fromhex(salt)
+        if scheme == "scrypt":
+            n, r, p = (int(x) for x in params.split(","))
+            digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p)
+        else:
+            digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, int(params))
+    except (ValueError, OverflowError):
+        return False  # damaged entry: nobody can log in with it, but it is not a server error
+    return hmac.compare_digest(digest.hex(), expected)
+
+
+class PasswordHasher:
+    """Runs hash_password / check_password in a bounded pool.
+
+    At most pool_size hashes run at once and at most max_waiting wait for a
+    worker; past that HasherBusy is raised. Successful checks are remembered in
+    an LRU cache (for ttl seconds) so a user logging in again is not re-hashed.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, pool_kind: str = POOL_KIND, max_waiting: int = MAX_WAITING,
+                 cache_size: int = CACHE_SIZE, cache_ttl: float = CACHE_TTL):
+        self.pool_size = pool_size
+        self.pool_kind = pool_kind
+        self.max_waiting = max_waiting
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.executor: Executor = None
+        self.slots = asyncio.Semaphore(pool_size)
+        self.waiting = 0
+        # Key: HMAC-SHA256 of username + password + stored hash (never the password itself)
+        self.cache: "OrderedDict[bytes, float]" = OrderedDict()
+        # Fresh per process, so cache keys cannot be precomputed from outside
+        self.cache_key = os.urandom(32)
+
+    def _pool(self) -> Executor:
+        if self.executor is None:
+            if self.pool_kind == "process":
+                self.executor = ProcessPoolExecutor(max_workers=self.pool_size)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="hasher")
+        return self.executor
+
+    async def _run(self, func, *args):
+        if self.waiting >= self.max_waiting:
+            raise HasherBusy()
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), func, *args)
+        finally:
+            self.slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, username: str, password: str, stored: str) -> bool:
+        key = hmac.new(self.cache_key, f"{username}\0{password}\0{stored}".encode(), hashlib.sha256).digest()
+        expires = self.cache.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                self.cache.move_to_end(key)
+                return True
+            del self.cache[key]
+
+        ok = await self._run(check_password, password, stored)
+        if ok and self.cache_size > 0:
+            self.cache[key] = time.monotonic() + self.cache_ttl
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)  # drop the least recently used
+        return ok
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
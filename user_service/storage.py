@@ -0,0 +1,175 @@
+# user_service/storage.py
+# Where users are saved. Two backends:
+#   log    - users.txt as an append-only log ("username:password" per line), compacted now and then
+#   sqlite - a SQLite database (WAL mode), looked up one user at a time
+# The service keeps users_db in memory as an index in front of the store.
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# How often data is forced to disk:
+#   always   - fsync after every write (safest, slowest)
+#   interval - fsync at most every FSYNC_INTERVAL seconds
+#   never    - leave it to the operating system
+FSYNC_POLICY = os.environ.get("USER_FSYNC", "interval")
+FSYNC_INTERVAL = float(os.environ.get("USER_FSYNC_INTERVAL", "1"))
+# Rewrite the log once it has this many outdated lines (and more outdated than live ones)
+COMPACT_MIN_STALE = int(os.environ.get("USER_COMPACT_MIN_STALE", "1000"))
+
+
+class UserStore:
+    """Base class for user storage backends"""
+
+    def load(self) -> Dict[str, str]:
+        """Users to put in the in-memory index when the store is opened"""
+        return {}
+
+    def get(self, username: str) -> Optional[str]:
+        """Look up one user that is not in the index (None if unknown)"""
+        return None
+
+    def add(self, username: str, password: str):
+        """Save a new user, or a new password for an existing one"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LogUserStore(UserStore):
+    """Append-only text log. Each write is one appended line, so cost does not grow with users."""
+
+    def __init__(self, path: str, fsync_policy: str = FSYNC_POLICY, compact_min_stale: int = COMPACT_MIN_STALE):
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.compact_min_stale = compact_min_stale
+        self.lock = threading.Lock()
+        self.users: Dict[str, str] = {}
+        self.lines = 0  # lines in the log, including outdated ones
+        self.torn = False
+        self.last_fsync = time.monotonic()
+        self.file = None
+
+    def read(self) -> Dict[str, str]:
+        """Parse the whole log in one go"""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            data = f.read()  # one read instead of a loop over the file
+        lines = data.splitlines()
+        self.torn = bool(data) and not data.endswith("\n")
+        if self.torn:
+            lines = lines[:-1]  # cut off mid-write (crash): the user was never registered
+        self.lines = len(lines)
+        # Later lines win, so a changed password replaces the old one
+        return dict(line.split(":", 1) for line in lines if ":" in line)
+
+    def load(self) -> Dict[str, str]:
+        self.users = self.read()
+        if self.torn:
+            # Last write was cut off (crash): remove it, so it is not read as a user next time
+            with open(self.path, "rb+") as f:
+                f.truncate(f.read().rfind(b"\n") + 1)
+            self.torn = False
+        self.file = open(self.path, "a")
+        return dict(self.users)
+
+    def add(self, username: str, password: str):
+        with self.lock:
+            self.file.write(f"{username}:{password}\n")
+            self.file.flush()
+            self.users[username] = password
+            self.lines += 1
+            self._maybe_fsync()
+            stale = self.lines - len(self.users)
+            if stale >= self.compact_min_stale and stale > len(self.users):
+                self._compact()
+
+    def _maybe_fsync(self):
+        if self.fsync_policy == "always":
+            os.fsync(self.file.fileno())
+        elif self.fsync_policy == "interval":
+            now = time.monotonic()
+            if now - self.last_fsync >= FSYNC_INTERVAL:
+                os.fsync(self.file.fileno())
+                self.last_fsync = now
+
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the log with one line per user, then swap it in atomically"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(f"{username}:{password}\n" for username, password in self.users.items())
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, "a")
+        self.lines = len(self.users)
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.flush()
+                if self.fsync_policy != "never":
+                    os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
+
+
+class SqliteUserStore(UserStore):
+    """SQLite backend. Nothing is loaded at startup; users are read when first needed."""
+
+    def __init__(self, path: str, fsync_policy: str = FSYNC_POLICY):
+        self.lock = threading.Lock()
+        # Writes happen in a worker thread, so the connection is shared (guarded by the lock)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        synchronous = {"always": "FULL", "interval": "NORMAL", "never": "OFF"}.get(fsync_policy, "NORMAL")
+        self.db.execute(f"PRAGMA synchronous={synchronous}")
+        self.db.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL)")
+
+    def import_log(self, log_path: str):
+        """Copy users from a users.txt log into an empty database (one-time migration)"""
+        if not os.path.exists(log_path):
+            return
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+                return
+            users = LogUserStore(log_path).read()
+            self.db.execute("BEGIN")
+            self.db.executemany("INSERT INTO users (username, password) VALUES (?, ?)", users.items())
+            self.db.execute("COMMIT")
+
+    def get(self, username: str) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, username: str, password: str):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO users (username, password) VALUES (?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET password = excluded.password",
+                (username, password),
+            )
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def make_store(kind: str, base_dir: str) -> UserStore:
+    """Build the backend named by USER_STORE ("log" or "sqlite")"""
+    if kind == "sqlite":
+        store = SqliteUserStore(os.path.join(base_dir, "users.db"))
+        store.import_log(os.path.join(base_dir, "users.txt"))
+        return store
+    if kind == "log":
+        return LogUserStore(os.path.join(base_dir, "users.txt"))
+    raise ValueError(f"Unknown user store: {kind}")